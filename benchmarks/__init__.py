@@ -0,0 +1,33 @@
+"""
+Benchmarks for fob_api
+
+Run from the repository root, e.g.: python -m benchmarks.traefik_config
+The environment below is only used when not already set so the benchmarks
+can run without the external services (headscale, openstack, smtp).
+"""
+from os import environ
+
+BENCHMARK_ENV = {
+    "DISABLE_DOTENV": "True",
+    "DATABASE_URL": "sqlite://",
+    "HEADSCALE_ENDPOINT": "http://127.0.0.1:8080",
+    "HEADSCALE_TOKEN": "benchmark",
+    "CELERY_BROKER_URL": "redis://127.0.0.1:6379",
+    "CELERY_RESULT_BACKEND": "redis://127.0.0.1:6379",
+    "JWT_SECRET_KEY": "benchmark",
+    "MAIL_SERVER": "127.0.0.1",
+    "MAIL_USERNAME": "benchmark@laboinfra.net",
+    "OS_USERNAME": "benchmark",
+    "OS_PASSWORD": "benchmark",
+    "OS_PROJECT_NAME": "benchmark",
+    "OS_USER_DOMAIN_NAME": "Default",
+    "OS_PROJECT_DOMAIN_NAME": "Default",
+    "OS_AUTH_URL": "http://127.0.0.1:5000/v3",
+    "OPENSTACK_DOMAIN_ID": "benchmark",
+    "OPENSTACK_ROLE_MEMBER_ID": "benchmark",
+    "TRAEFIK_CONFIG_PASSWORD": "benchmark",
+    "TRAEFIK_HOST_IP": "127.0.0.1",
+}
+
+for key, value in BENCHMARK_ENV.items():
+    environ.setdefault(key, value)
@@ -0,0 +1,281 @@
+"""
+End-to-end benchmark of the API routes and Celery tasks
+
+The app runs in process (TestClient, tasks executed eagerly) on a database filled by fob_api.dataset,
+Headscale and Keystone/Nova/Cinder are served by the fakes of benchmarks.fakes with configurable latency and failure rate.
+Redis is fakeredis when installed unless REDIS_URL is set. Throughput and p50/p99 latency are
+printed for every scenario and saved in benchmarks/results/ to compare a later run against.
+
+DATABASE_URL defaults to a temporary SQLite file, set it to benchmark MariaDB (the database must be empty).
+
+Usage: python -m benchmarks.e2e [--users 2000] [--requests 200] [--concurrency 4] [--latency 5]
+                                [--failure-rate 0] [--save NAME] [--compare benchmarks/results/NAME.json]
+"""
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+from io import StringIO
+from os import environ, makedirs, path
+from platform import python_version
+from random import Random
+from statistics import mean, quantiles
+from subprocess import run, DEVNULL
+from tempfile import mkdtemp
+from time import perf_counter
+import json
+import sys
+
+from benchmarks.fakes import FakeHeadscale, FakeOpenStack
+
+RESULTS_DIR = path.join(path.dirname(__file__), "results")
+# the dataset is generated with prefix "user": users user-<n>, projects user-project-<n>, user-0 is admin
+ADMIN_USERNAME = "user-0"
+PASSWORD = "benchmark-password"
+
+
+def parse_args() -> Namespace:
+    parser = ArgumentParser(description="End-to-end benchmark of the fob_api routes and Celery tasks")
+    parser.add_argument("--users", type=int, default=2000, help="seeded users")
+    parser.add_argument("--projects", type=int, default=1000, help="seeded projects")
+    parser.add_argument("--members", type=int, default=5, help="members of each project")
+    parser.add_argument("--shares", type=int, default=3, help="quota shares of each project")
+    parser.add_argument("--ledger", type=int, default=10, help="quota adjustments of each user")
+    parser.add_argument("--groups", type=int, default=0, help="headscale groups besides cloud-edge")
+    parser.add_argument("--proxies", type=int, default=5000, help="seeded proxy service maps")
+    parser.add_argument("--requests", type=int, default=200, help="measured calls per scenario")
+    parser.add_argument("--warmup", type=int, default=10, help="calls per scenario before measuring")
+    parser.add_argument("--concurrency", type=int, default=4, help="calls in flight")
+    parser.add_argument("--latency", type=float, default=5, help="latency of the fake services in ms")
+    parser.add_argument("--jitter", type=float, default=0, help="random latency added by the fakes, up to this many ms")
+    parser.add_argument("--failure-rate", type=float, default=0, help="probability of a 503 from the fakes")
+    parser.add_argument("--only", help="comma separated scenario name filter, e.g. token,quota")
+    parser.add_argument("--save", help="result name, saved to benchmarks/results/NAME.json (default: date and commit)")
+    parser.add_argument("--compare", help="previous result file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change counted as a regression")
+    return parser.parse_args()
+
+
+def configure_environment(args: Namespace, headscale: FakeHeadscale, openstack: FakeOpenStack) -> None:
+    """
+    Point fob_api to the fakes, must run before fob_api is imported (Config is read once)
+    """
+    environ["HEADSCALE_ENDPOINT"] = headscale.url
+    environ["OS_AUTH_URL"] = openstack.url + "/v3"
+    workdir = mkdtemp(prefix="fob-bench-")
+    if environ["DATABASE_URL"] == "sqlite://":
+        # in memory sqlite is one database per thread, the routes run in a thread pool
+        environ["DATABASE_URL"] = f"sqlite:///{workdir}/benchmark.db"
+    environ["TRAEFIK_CONFIG_FILE"] = f"{workdir}/traefik.yml"
+    environ.setdefault("RATE_LIMIT_LOGIN", f"{args.requests * 10}/1")
+    # no smtp server to validate against
+    environ["STARTUP_VALIDATION"] = "off"
+
+
+def use_fakeredis() -> bool:
+    """
+    Replace redis by fakeredis unless REDIS_URL is set, without redis locks and caches fail open
+    """
+    if environ.get("REDIS_URL"):
+        return False
+    try:
+        from fakeredis import FakeRedis
+    except ImportError:
+        print("fakeredis is not installed and REDIS_URL is not set, locks and caches run without redis")
+        return False
+    import fob_api.database
+    fob_api.database.Redis = FakeRedis
+    fob_api.database.get_redis.cache_clear()
+    return True
+
+
+def measure(call, arguments: list, concurrency: int) -> dict:
+    """
+    Run call on every argument with concurrency calls in flight
+    A call fails when it raises or returns False
+    """
+    def timed(argument) -> tuple[float, bool]:
+        start = perf_counter()
+        try:
+            ok = call(argument) is not False
+        except Exception:
+            ok = False
+        return perf_counter() - start, ok
+
+    start = perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        outcomes = list(pool.map(timed, arguments))
+    wall = perf_counter() - start
+    timings = sorted(duration for duration, _ in outcomes)
+    percentiles = quantiles(timings, n=100, method="inclusive") if len(timings) > 1 else timings * 99
+    return {
+        "requests": len(outcomes),
+        "errors": sum(not ok for _, ok in outcomes),
+        "throughput": len(outcomes) / wall,
+        "mean_ms": mean(timings) * 1000,
+        "p50_ms": percentiles[49] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+        "max_ms": timings[-1] * 1000,
+    }
+
+
+def build_scenarios(client, args: Namespace) -> list[tuple[str, callable, callable]]:
+    """
+    :return: (name, call(argument), argument(random)) of every scenario
+    """
+    from fob_api.tasks import core, headscale, proxy
+
+    def ok(response) -> bool:
+        return response.status_code < 400
+
+    token = client.post("/token", data={"username": ADMIN_USERNAME, "password": PASSWORD}).json()["access_token"]
+    auth = {"Authorization": f"Bearer {token}"}
+    traefik = ("traefik", environ["TRAEFIK_CONFIG_PASSWORD"])
+
+    def user(rng: Random) -> str:
+        return f"user-{rng.randrange(args.users)}"
+
+    def project(rng: Random) -> str:
+        return f"user-project-{rng.randrange(args.projects)}"
+
+    return [
+        ("POST /token",
+         lambda username: ok(client.post("/token", data={"username": username, "password": PASSWORD})), user),
+        ("GET /devices/{username}",
+         lambda username: ok(client.get(f"/devices/{username}", headers=auth)), user),
+        ("GET /openstack/projects/{username}",
+         lambda username: ok(client.get(f"/openstack/projects/{username}", headers=auth)), user),
+        ("GET /quota/user/{username}/total",
+         lambda username: ok(client.get(f"/quota/user/{username}/total", headers=auth)), user),
+        ("GET /quota/project/{project_name}/total",
+         lambda name: ok(client.get(f"/quota/project/{name}/total", headers=auth)), project),
+        ("GET /quota/project/{project_name}/adjustements",
+         lambda name: ok(client.get(f"/quota/project/{name}/adjustements", headers=auth)), project),
+        ("GET /quota/project/{project_name}/sync",
+         lambda name: ok(client.get(f"/quota/project/{name}/sync", headers=auth)), project),
+        ("GET /proxy/",
+         lambda _: ok(client.get("/proxy/", auth=traefik)), lambda rng: None),
+        ("task sync_user",
+         lambda username: core.sync_user.apply(args=[username]).successful(), user),
+        ("task fastonboard.headscale.sync_policy",
+         lambda _: headscale.update_headscale_policy.apply().successful(), lambda rng: None),
+        ("task fastonboard.proxy.publish_config",
+         lambda _: proxy.publish_traefik_config.apply().successful(), lambda rng: None),
+        ("task fastonboard.retention.purge_expired",
+         lambda _: core.purge_expired_rows.apply().successful(), lambda rng: None),
+    ]
+
+
+def git_commit() -> str | None:
+    result = run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, stdin=DEVNULL)
+    return result.stdout.strip() or None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Print the change of every scenario against baseline
+    :return: scenarios with a p50 latency or a throughput worse than tolerance
+    """
+    regressions = []
+    print(f"\nCompared with {baseline['meta'].get('name')} ({baseline['meta'].get('commit')})")
+    for name, result in results.items():
+        previous = baseline["results"].get(name)
+        if not previous:
+            print(f"{name:48} new scenario")
+            continue
+        p50 = result["p50_ms"] / previous["p50_ms"] - 1
+        p99 = result["p99_ms"] / previous["p99_ms"] - 1
+        throughput = result["throughput"] / previous["throughput"] - 1
+        regressed = p50 > tolerance or throughput < -tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:48} p50 {p50:+7.1%}  p99 {p99:+7.1%}  throughput {throughput:+7.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main() -> None:
+    args = parse_args()
+    rng = Random(42)
+    headscale = FakeHeadscale(latency=args.latency / 1000, jitter=args.jitter / 1000).start()
+    openstack = FakeOpenStack(latency=args.latency / 1000, jitter=args.jitter / 1000).start()
+    configure_environment(args, headscale, openstack)
+
+    with redirect_stdout(StringIO()):
+        fakeredis = use_fakeredis()
+        from fastapi.testclient import TestClient
+        from sqlmodel import Session, SQLModel
+        from fob_api import engine
+        from fob_api.dataset import DatasetGenerator
+        from fob_api.worker import celery
+        from fob_api.main import app
+
+    celery.conf.task_always_eager = True
+    SQLModel.metadata.create_all(engine)
+    start = perf_counter()
+    with Session(engine) as session:
+        DatasetGenerator(session, "user", seed=42).generate(
+            users=args.users,
+            admins=1,
+            password=PASSWORD,
+            ledger=args.ledger,
+            projects=args.projects,
+            members=args.members,
+            shares=args.shares,
+            groups=args.groups,
+            proxies=args.proxies,
+        )
+        session.commit()
+    print(f"Seeded {args.users} users, {args.projects} projects, {args.proxies} proxies "
+          f"in {perf_counter() - start:.1f}s on {engine.url.get_backend_name()}")
+    for i in range(args.users):
+        headscale.add_user(f"user-{i}")
+
+    results = {}
+    only = args.only.split(",") if args.only else None
+    with TestClient(app, raise_server_exceptions=False) as client:
+        for name, call, argument in build_scenarios(client, args):
+            if only and not any(word in name for word in only):
+                continue
+            # failures are injected only in the measured calls
+            headscale.failure_rate = openstack.failure_rate = 0
+            with redirect_stdout(StringIO()):
+                measure(call, [argument(rng) for _ in range(args.warmup)], args.concurrency)
+                headscale.failure_rate = openstack.failure_rate = args.failure_rate
+                results[name] = measure(call, [argument(rng) for _ in range(args.requests)], args.concurrency)
+            result = results[name]
+            print(f"{name:48} {result['throughput']:8.1f} req/s  p50 {result['p50_ms']:7.1f} ms  "
+                  f"p99 {result['p99_ms']:7.1f} ms  errors {result['errors']}/{result['requests']}")
+
+    headscale.stop()
+    openstack.stop()
+
+    commit = git_commit()
+    name = args.save or f"{datetime.now():%Y%m%d-%H%M%S}-{commit or 'unknown'}"
+    report = {
+        "meta": {
+            "name": name,
+            "commit": commit,
+            "created_at": datetime.now().isoformat(),
+            "python": python_version(),
+            "database": engine.url.get_backend_name(),
+            "redis": "fakeredis" if fakeredis else environ.get("REDIS_URL"),
+            "parameters": vars(args),
+        },
+        "results": results,
+    }
+    makedirs(RESULTS_DIR, exist_ok=True)
+    result_path = path.join(RESULTS_DIR, f"{name}.json")
+    with open(result_path, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results saved to {result_path}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+In-process fakes of the external services called by fob_api, served over real HTTP
+so the clients (requests, keystoneauth, novaclient, cinderclient) run their full code path
+
+Usage:
+    with FakeHeadscale(latency=0.005) as headscale, FakeOpenStack(failure_rate=0.01) as openstack:
+        environ["HEADSCALE_ENDPOINT"] = headscale.url
+        environ["OS_AUTH_URL"] = openstack.url + "/v3"
+"""
+from datetime import datetime, timedelta
+from hashlib import md5
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import sleep
+from urllib.parse import parse_qs, urlparse
+import json
+import random
+import re
+
+HEADSCALE_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+
+class FakeRequestHandler(BaseHTTPRequestHandler):
+    # keep-alive like the real services, the clients reuse their connections
+    protocol_version = "HTTP/1.1"
+
+    def handle_request(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        url = urlparse(self.path)
+        status, body, headers = self.server.dispatch(
+            self.command, url.path, parse_qs(url.query), json.loads(raw_body) if raw_body else None
+        )
+        content = b"" if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if content:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = handle_request
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class FakeService(ThreadingHTTPServer):
+    """
+    HTTP server on a free local port answering from a route table
+    Every request waits latency (+ random jitter) seconds and fails with a 503 with probability failure_rate,
+    both can be changed while the server runs
+    """
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0):
+        """
+        :param latency: seconds added to every response
+        :param jitter: up to this many seconds randomly added to latency
+        :param failure_rate: probability (0-1) of answering 503 instead of handling the request
+        """
+        super().__init__(("127.0.0.1", 0), FakeRequestHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.failures = 0
+        self.state_lock = Lock()
+        # (method, compiled path regex, handler(match, query, body) -> (status, body[, headers]))
+        self.routes: list[tuple[str, re.Pattern, callable]] = []
+        self._thread: Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def route(self, method: str, pattern: str, handler) -> None:
+        self.routes.append((method, re.compile(f"^{pattern}/?$"), handler))
+
+    def dispatch(self, method: str, path: str, query: dict, body) -> tuple[int, object, dict]:
+        with self.state_lock:
+            self.requests += 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            sleep(delay)
+        if self.failure_rate and random.random() < self.failure_rate:
+            with self.state_lock:
+                self.failures += 1
+            return 503, {"error": "injected failure"}, {}
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if route_method == method and match:
+                result = handler(match, query, body)
+                return result if len(result) == 3 else (*result, {})
+        return 404, {"error": f"{method} {path} not found"}, {}
+
+    def start(self) -> "FakeService":
+        self._thread = Thread(target=self.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeService":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class FakeHeadscale(FakeService):
+    """
+    Headscale REST API (/api/v1) with users, nodes, pre auth keys and the ACL policy
+    Every user gets devices_per_user nodes when created
+    """
+
+    def __init__(self, devices_per_user: int = 3, **kwargs):
+        super().__init__(**kwargs)
+        self.devices_per_user = devices_per_user
+        self.users: dict[str, dict] = {}
+        self.nodes: dict[str, list[dict]] = {}
+        self.policy = json.dumps({"acls": [], "hosts": {}, "groups": {}, "tagOwners": {}})
+        self.policy_updated_at = self.now()
+        self.route("GET", r"/api/v1/user", self.list_users)
+        self.route("POST", r"/api/v1/user", self.create_user)
+        self.route("GET", r"/api/v1/user/(?P<name>[^/]+)", self.get_user)
+        self.route("GET", r"/api/v1/node", self.list_nodes)
+        self.route("DELETE", r"/api/v1/node/(?P<id>[^/]+)", self.delete_node)
+        self.route("POST", r"/api/v1/preauthkey", self.create_preauthkey)
+        self.route("GET", r"/api/v1/policy", self.get_policy)
+        self.route("PUT", r"/api/v1/policy", self.set_policy)
+
+    @staticmethod
+    def now(delta: timedelta = timedelta()) -> str:
+        return (datetime.now() + delta).strftime(HEADSCALE_DATE_FORMAT)
+
+    def add_user(self, name: str) -> dict:
+        with self.state_lock:
+            if name not in self.users:
+                user_id = str(len(self.users) + 1)
+                self.users[name] = {"id": user_id, "name": name, "created_at": self.now()}
+                self.nodes[name] = [self.make_node(self.users[name], i) for i in range(self.devices_per_user)]
+            return self.users[name]
+
+    def make_node(self, user: dict, index: int) -> dict:
+        node_id = f"{user['id']}{index:03d}"
+        return {
+            "id": node_id,
+            "machineKey": f"mkey:{node_id}",
+            "nodeKey": f"nodekey:{node_id}",
+            "discoKey": f"discokey:{node_id}",
+            "ipAddresses": [f"100.64.{int(user['id']) // 250 % 256}.{int(user['id']) % 250 + 1}"],
+            "name": f"{user['name']}-device-{index}",
+            "user": user,
+            "lastSeen": self.now(),
+            "expiry": "0001-01-01T00:00:00Z",
+            "preAuthKey": {},
+            "createdAt": self.now(),
+            "registerMethod": "REGISTER_METHOD_CLI",
+            "forcedTags": [],
+            "invalidTags": [],
+            "validTags": [],
+            "givenName": f"{user['name']}-device-{index}",
+            "online": index == 0,
+        }
+
+    def list_users(self, match, query, body):
+        return 200, {"users": list(self.users.values())}
+
+    def create_user(self, match, query, body):
+        return 200, {"user": self.add_user(body["name"])}
+
+    def get_user(self, match, query, body):
+        user = self.users.get(match["name"])
+        if not user:
+            return 404, {"code": 5, "message": "User not found"}
+        return 200, {"user": user}
+
+    def list_nodes(self, match, query, body):
+        username = query.get("user", [""])[0]
+        if username:
+            return 200, {"nodes": self.nodes.get(username, [])}
+        return 200, {"nodes": [node for nodes in self.nodes.values() for node in nodes]}
+
+    def delete_node(self, match, query, body):
+        with self.state_lock:
+            for nodes in self.nodes.values():
+                nodes[:] = [node for node in nodes if node["id"] != match["id"]]
+        return 200, {}
+
+    def create_preauthkey(self, match, query, body):
+        return 200, {"preAuthKey": {
+            "user": body["user"],
+            "id": str(self.requests),
+            "key": md5(f"{body['user']}{self.requests}".encode()).hexdigest(),
+            "reusable": body.get("reusable", False),
+            "ephemeral": body.get("ephemeral", False),
+            "used": False,
+            "expiration": body.get("expiration") or self.now(timedelta(hours=1)),
+            "createdAt": self.now(),
+            "aclTags": body.get("aclTags", []),
+        }}
+
+    def get_policy(self, match, query, body):
+        return 200, {"policy": self.policy, "updatedAt": self.policy_updated_at}
+
+    def set_policy(self, match, query, body):
+        self.policy = body["policy"]
+        self.policy_updated_at = self.now()
+        return 200, {"policy": self.policy, "updatedAt": self.policy_updated_at}
+
+
+class FakeOpenStack(FakeService):
+    """
+    Keystone v3 (password auth, projects, users, role grants), Nova and Cinder quota sets on one server
+    The token catalog points the compute and volume services to this server, OS_AUTH_URL is url + "/v3"
+    Projects and users looked up by name always exist, their id is derived from the name
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.quota_sets: dict[str, dict] = {}
+        self.route("GET", r"/v3", self.identity_version)
+        self.route("POST", r"/v3/auth/tokens", self.issue_token)
+        self.route("GET", r"/v3/endpoints", lambda m, q, b: (200, {"endpoints": [], "links": {"self": None, "next": None}}))
+        self.route("GET", r"/v3/projects", lambda m, q, b: self.find("project", q))
+        self.route("POST", r"/v3/projects", lambda m, q, b: (201, {"project": self.resource("project", b["project"]["name"])}))
+        self.route("DELETE", r"/v3/projects/[^/]+", lambda m, q, b: (204, None))
+        self.route("GET", r"/v3/users", lambda m, q, b: self.find("user", q))
+        self.route("POST", r"/v3/users", lambda m, q, b: (201, {"user": self.resource("user", b["user"]["name"])}))
+        self.route("PATCH", r"/v3/users/(?P<id>[^/]+)", lambda m, q, b: (200, {"user": {**b["user"], "id": m["id"]}}))
+        self.route("PUT", r"/v3/projects/[^/]+/users/[^/]+/roles/[^/]+", lambda m, q, b: (204, None))
+        self.route("DELETE", r"/v3/projects/[^/]+/users/[^/]+/roles/[^/]+", lambda m, q, b: (204, None))
+        self.route("GET", r"/compute/v2\.1", lambda m, q, b: (200, self.version_document("v2.1", "/compute/v2.1")))
+        self.route("PUT", r"/compute/v2\.1/os-quota-sets/(?P<id>[^/]+)", self.update_quota_set)
+        self.route("GET", r"/volume/v3/[^/]+", lambda m, q, b: (200, self.version_document("v3.0", "/volume/v3")))
+        self.route("PUT", r"/volume/v3/[^/]+/os-quota-sets/(?P<id>[^/]+)", self.update_quota_set)
+
+    @staticmethod
+    def resource_id(kind: str, name: str) -> str:
+        return md5(f"{kind}:{name}".encode()).hexdigest()
+
+    def resource(self, kind: str, name: str) -> dict:
+        resource_id = self.resource_id(kind, name)
+        return {
+            "id": resource_id,
+            "name": name,
+            "domain_id": "default",
+            "enabled": True,
+            "links": {"self": f"{self.url}/v3/{kind}s/{resource_id}"},
+        }
+
+    def find(self, kind: str, query: dict):
+        names = query.get("name", [])
+        return 200, {f"{kind}s": [self.resource(kind, name) for name in names], "links": {"self": None, "next": None}}
+
+    def version_document(self, version: str, path: str) -> dict:
+        return {"version": {
+            "id": version,
+            "status": "CURRENT",
+            "links": [{"rel": "self", "href": f"{self.url}{path}/"}],
+            "media-types": [],
+        }}
+
+    def identity_version(self, match, query, body):
+        return 200, self.version_document("v3.14", "/v3")
+
+    def issue_token(self, match, query, body):
+        project_id = self.resource_id("project", "admin")
+        endpoints = {
+            "identity": f"{self.url}/v3",
+            "compute": f"{self.url}/compute/v2.1",
+            "volumev3": f"{self.url}/volume/v3/{project_id}",
+            "block-storage": f"{self.url}/volume/v3/{project_id}",
+        }
+        token = {
+            "methods": ["password"],
+            "user": {"id": self.resource_id("user", "admin"), "name": "admin", "domain": {"id": "default", "name": "Default"}},
+            "project": {"id": project_id, "name": "admin", "domain": {"id": "default", "name": "Default"}},
+            "roles": [{"id": "admin", "name": "admin"}],
+            "issued_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.000000Z"),
+            "expires_at": (datetime.utcnow() + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S.000000Z"),
+            "catalog": [{
+                "type": service_type,
+                "name": service_type,
+                "id": service_type,
+                "endpoints": [
+                    {"id": f"{service_type}-{interface}", "interface": interface, "region": "RegionOne",
+                     "region_id": "RegionOne", "url": url}
+                    for interface in ("public", "internal", "admin")
+                ],
+            } for service_type, url in endpoints.items()],
+        }
+        return 201, {"token": token}, {"X-Subject-Token": md5(str(random.random()).encode()).hexdigest()}
+
+    def update_quota_set(self, match, query, body):
+        with self.state_lock:
+            quota_set = self.quota_sets.setdefault(match["id"], {})
+            quota_set.update(body["quota_set"])
+            return 200, {"quota_set": {**quota_set, "id": match["id"]}}
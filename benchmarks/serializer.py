@@ -0,0 +1,103 @@
+"""
+Benchmark the Celery pydantic serializer encode/decode throughput
+
+Compares the previous implementation (JSONEncoder subclass, dir() lookup and parse_obj
+per decoded object) with the registry based serializer on the stdlib and orjson backends.
+Payloads are shaped like Celery task messages and results carrying SyncInfo / TaskInfo.
+
+Usage: python -m benchmarks.serializer [messages] [rounds]
+"""
+from json import JSONEncoder, dumps, loads
+from statistics import median
+from sys import argv
+from time import perf_counter
+import warnings
+
+from pydantic import BaseModel
+
+from fob_api import serializer
+from fob_api.models import api as api_models
+from fob_api.models.api import SyncInfo, TaskInfo
+
+
+class LegacyPydanticSerializer(JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, BaseModel):
+            return obj.model_dump() | {'__type__': type(obj).__name__}
+        return JSONEncoder.default(self, obj)
+
+
+def legacy_decoder(obj):
+    if '__type__' in obj and obj['__type__'] in dir(api_models):
+        cls = getattr(api_models, obj['__type__'])
+        return cls.parse_obj(obj)
+    return obj
+
+
+def legacy_dumps(obj):
+    return dumps(obj, cls=LegacyPydanticSerializer)
+
+
+def legacy_loads(obj):
+    return loads(obj, object_hook=legacy_decoder)
+
+
+def payloads(messages: int) -> list:
+    """
+    Task results (SyncInfo) and task status objects (TaskInfo) as sent through celery
+    """
+    items = []
+    for i in range(messages):
+        sync = SyncInfo(username=f"student-{i}", last_synced=f"2026-10-19T12:{i % 60:02d}:00")
+        items.append({"status": "SUCCESS", "result": sync, "traceback": None, "children": [], "task_id": str(i)})
+        items.append([[f"student-{i}"], {}, {"callbacks": None, "errbacks": None, "chain": None, "chord": None}])
+        items.append(TaskInfo(id=str(i), status="SUCCESS", result={"username": f"student-{i}", "synced": True}))
+    return items
+
+
+def measure(dumps_fn, loads_fn, items: list, rounds: int) -> tuple[float, float]:
+    encode, decode = [], []
+    for _ in range(rounds):
+        start = perf_counter()
+        encoded = [dumps_fn(item) for item in items]
+        encode.append(perf_counter() - start)
+        start = perf_counter()
+        for data in encoded:
+            loads_fn(data)
+        decode.append(perf_counter() - start)
+    return median(encode), median(decode)
+
+
+def main() -> None:
+    messages = int(argv[1]) if len(argv) > 1 else 10000
+    rounds = int(argv[2]) if len(argv) > 2 else 5
+    items = payloads(messages)
+
+    implementations = [
+        ("legacy", legacy_dumps, legacy_loads),
+        ("registry stdlib", serializer.stdlib_dumps, serializer.stdlib_loads),
+    ]
+    if serializer.orjson:
+        implementations.append(("registry orjson", serializer.orjson_dumps, serializer.orjson_loads))
+    else:
+        print("orjson not installed, skipping the orjson backend")
+
+    # every implementation must round trip to the same objects
+    for name, dumps_fn, loads_fn in implementations:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            assert [loads_fn(dumps_fn(item)) for item in items[:30]] == items[:30], name
+
+    print(f"payloads: {len(items)} rounds: {rounds}")
+    for name, dumps_fn, loads_fn in implementations:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            encode, decode = measure(dumps_fn, loads_fn, items, rounds)
+        print(
+            f"{name:>16}: encode {len(items) / encode:>9.0f} msg/s ({encode * 1000:.1f} ms)"
+            f"  decode {len(items) / decode:>9.0f} msg/s ({decode * 1000:.1f} ms)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark ProxyManager.build_treafik_config build time and peak memory
+
+Usage: python -m benchmarks.traefik_config [proxies] [rounds]
+"""
+from statistics import median
+from sys import argv
+from time import perf_counter
+import tracemalloc
+
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+from fob_api.dataset import DatasetGenerator
+from fob_api.managers import ProxyManager
+
+PROJECTS = 500
+
+
+def main() -> None:
+    proxies = int(argv[1]) if len(argv) > 1 else 10000
+    rounds = int(argv[2]) if len(argv) > 2 else 10
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        DatasetGenerator(session).generate(
+            users=PROJECTS, ledger=0, projects=PROJECTS, members=0, shares=0, proxies=proxies, dns_failure_rate=0
+        )
+        session.commit()
+        pm = ProxyManager(session)
+
+        timings = []
+        for _ in range(rounds):
+            start = perf_counter()
+            config = pm.build_treafik_config()
+            timings.append(perf_counter() - start)
+
+        tracemalloc.start()
+        pm.build_treafik_config()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        start = perf_counter()
+        body = pm.render_traefik_config()
+        render_time = perf_counter() - start
+
+    print(f"proxies: {proxies} rounds: {rounds}")
+    print(f"routers: {len(config['http']['routers'])} services: {len(config['http']['services'])}")
+    print(f"build median: {median(timings) * 1000:.1f} ms min: {min(timings) * 1000:.1f} ms max: {max(timings) * 1000:.1f} ms")
+    print(f"build peak memory: {peak / 1024 / 1024:.1f} MiB")
+    print(f"build + json render: {render_time * 1000:.1f} ms ({len(body) / 1024:.0f} KiB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,14 @@ export DISABLE_DOTENV=True
 case $app in
   "worker")
     echo "Starting worker"
+    # WORKER_QUEUES limits the worker to some queues (e.g. "identity,quota"), all queues by default
+    # queues: celery, identity, policy, quota, dns, mail, housekeeping (see fob_api/worker.py)
+    if [ -n "$WORKER_QUEUES" ]; then
+      set -- -Q "$WORKER_QUEUES" -n "${WORKER_QUEUES//,/-}@%h" "$@"
+    fi
+    # pool processes write their metrics there, the exporter of the worker aggregates them
+    export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/fob_worker_metrics}
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
     exec celery -A fob_api.worker worker --loglevel=info -E $@
     ;;
   "beat")
@@ -36,7 +44,13 @@ case $app in
     echo "Starting web"
     # make migrations
     alembic upgrade head
-    exec uvicorn fob_api.main:app --host 0.0.0.0 --port 8000 $@
+    # each uvicorn worker writes its metrics there, /metrics aggregates them
+    export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/fob_api_metrics}
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+    # behind traefik the client address is taken from X-Forwarded-For (rate limits are per client ip),
+    # only when the connection comes from FORWARDED_ALLOW_IPS (comma separated ips or networks)
+    exec uvicorn fob_api.main:app --host 0.0.0.0 --port 8000 \
+      --proxy-headers --forwarded-allow-ips "${FORWARDED_ALLOW_IPS:-127.0.0.1}" $@
     ;;
     *)
         echo "Invalid APP env variable"
@@ -1,5 +1,6 @@
 from datetime import datetime
 from datetime import timedelta
+from threading import Lock
 from typing import Annotated
 from uuid import uuid4
 
@@ -11,9 +12,10 @@ from jose.jwt import JWTError, ExpiredSignatureError, JWTClaimsError
 from sqlmodel import Session, select
 
 from fob_api.config import Config
-from fob_api.models.database import User, ProjectUserMembership, Project
+from fob_api.models.database import User, Project
 from fob_api.models.database import Token as TokenDB
 from fob_api import engine
+from .cache import ProjectAccess, project_access_cache
 
 password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -22,6 +24,8 @@ http_basic_security = HTTPBasic()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 jwt_secret = Config().jwt_secret_key
 jwt_expire_days = 15
+jwt_stateless = Config().jwt_stateless_access_tokens
+jwt_access_expire_minutes = Config().jwt_access_token_expire_minutes
 
 if not jwt_secret:
     raise ValueError("JWT secret not set")
@@ -34,34 +38,111 @@ def hash_password(password: str) -> str:
     """
     return password_context.hash(password)
 
-def make_token_data(username: str) -> dict:
+# prefix of a password that can never match, used for accounts waiting for their first reset
+UNUSABLE_PASSWORD_PREFIX = "!"
+
+def make_unusable_password() -> str:
+    """
+    Build a password value no input can verify against, cheaper than hashing a random password
+    :return: unusable password marker
+    """
+    return UNUSABLE_PASSWORD_PREFIX + uuid4().hex
+
+def is_password_usable(hashed_password: str) -> bool:
+    return not hashed_password.startswith(UNUSABLE_PASSWORD_PREFIX)
+
+class TokenRevocationSet:
+    """
+    In memory set of revoked stateless access tokens
+    Entries are dropped once the token they refer to would have expired anyway
+    Note: this set is local to the process, each uvicorn worker keeps its own
+    """
+
+    def __init__(self):
+        self._tokens: dict[str, datetime] = {}
+        self._lock = Lock()
+
+    def add(self, jti: str, expires_at: datetime) -> None:
+        with self._lock:
+            now = datetime.now()
+            self._tokens = {k: v for k, v in self._tokens.items() if v > now}
+            self._tokens[jti] = expires_at
+
+    def is_revoked(self, jti: str) -> bool:
+        expires_at = self._tokens.get(jti)
+        return expires_at is not None and expires_at > datetime.now()
+
+revoked_tokens = TokenRevocationSet()
+
+def make_token_data(username: str, token_type: str = "access") -> dict:
+    """
+    Build the claims of a new token
+    :param username: subject of the token
+    :param token_type: "access" or "refresh", access tokens are short-lived in stateless mode
+    :return: claims dict ready to be encoded
+    """
+    now = datetime.now()
+    if jwt_stateless and token_type == "access":
+        expire = now + timedelta(minutes=jwt_access_expire_minutes)
+    else:
+        expire = now + timedelta(days=jwt_expire_days)
     return {
-        "exp": datetime.now() + timedelta(days=jwt_expire_days),
-        "iat": datetime.now(),
+        "exp": expire,
+        "iat": now,
         "jti": str(uuid4()),
-        "nbf": datetime.now(),
-        "sub": str(username)
+        "nbf": now,
+        "sub": str(username),
+        "typ": token_type
     }
 
 def encode_token(token_data) -> str:
     return jwt.encode(token_data, jwt_secret, algorithm="HS256")
 
-def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> User:
+def decode_token(token: str) -> dict:
     try:
-        payload = jwt.decode(token, jwt_secret, algorithms=["HS256"])
-        with Session(engine) as session:
-            user = session.exec(select(User).where(User.username == payload["sub"])).first()
-            token = session.exec(select(TokenDB).where(TokenDB.token_id == payload["jti"])).first()
-            if user and token:
-                return user
-        raise HTTPException(status_code=401, detail="Invalid token")
+        return jwt.decode(token, jwt_secret, algorithms=["HS256"])
     except (JWTClaimsError, ExpiredSignatureError, JWTError) as e:
         raise HTTPException(status_code=401, detail=f"JWT Error: {e}")
 
+def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> User:
+    payload = decode_token(token)
+    # tokens issued before stateless mode have no type and are always checked against database
+    token_type = payload.get("typ")
+    if token_type == "refresh":
+        raise HTTPException(status_code=401, detail="Refresh token cannot be used as access token")
+    with Session(engine) as session:
+        user = session.exec(select(User).where(User.username == payload["sub"])).first()
+        if jwt_stateless and token_type == "access":
+            valid = not revoked_tokens.is_revoked(payload["jti"])
+        else:
+            valid = session.exec(select(TokenDB).where(TokenDB.token_id == payload["jti"])).first() is not None
+        if user and valid:
+            return user
+    raise HTTPException(status_code=401, detail="Invalid token")
+
+def get_refresh_token_user(token: Annotated[str, Depends(oauth2_scheme)]) -> User:
+    """
+    Return the user owning a refresh token
+    Without stateless mode any valid token can be refreshed
+    """
+    if not jwt_stateless:
+        return get_current_user(token)
+    payload = decode_token(token)
+    if payload.get("typ") != "refresh":
+        raise HTTPException(status_code=401, detail="A refresh token is required")
+    with Session(engine) as session:
+        user = session.exec(select(User).where(User.username == payload["sub"])).first()
+        token = session.exec(select(TokenDB).where(TokenDB.token_id == payload["jti"])).first()
+        if user and token:
+            return user
+    raise HTTPException(status_code=401, detail="Invalid token")
+
 def basic_auth_validator(username: str, password: str) -> User:
     with Session(engine) as session:
         user = session.exec(select(User).where(User.username == username)).first()
-        if not user or not password_context.verify(password, user.password):
+        if not user or not is_password_usable(user.password):
+            return False
+        if not password_context.verify(password, user.password):
             return False
         return user
 
@@ -75,18 +156,27 @@ def is_admin_or_self(user: User, username: str):
     if not user.is_admin and user.username != username:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
+def get_project_access(user: User, project_id: int) -> ProjectAccess:
+    """Return the cached owner/member decision of the user on the project"""
+    access = project_access_cache.get(user.id, project_id)
+    if not access:
+        raise HTTPException(status_code=404, detail="Project not found cannot check permissions")
+    return access
+
+def can_access_project(user: User, project_id: int) -> bool:
+    """Check if the user is an admin, the owner or a member of the project"""
+    if user.is_admin:
+        return True
+    access = get_project_access(user, project_id)
+    return access.is_owner or access.is_member
+
+def invalidate_project_access(project_id: int, user_id: int | None = None) -> None:
+    """Forget cached decisions after a membership change or a project deletion"""
+    project_access_cache.invalidate(project_id, user_id)
+
 def is_project_owner_or_member(user: User, project_id: int) -> Project:
     """Check if the user is the owner or a member of the project"""
-    with Session(engine) as session:
-        project = session.get(Project, project_id)
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found cannot check permissions")
-        project_member = session.exec(
-            select(ProjectUserMembership).where(
-                (ProjectUserMembership.project_id == project_id) &
-                (ProjectUserMembership.user_id == user.id)
-            )
-        ).first()
-        if project.owner_id == user.id or project_member:
-            return project
+    access = get_project_access(user, project_id)
+    if access.is_owner or access.is_member:
+        return access.project
     raise HTTPException(status_code=403, detail="Not enough permissions")
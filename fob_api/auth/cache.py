@@ -0,0 +1,129 @@
+from contextvars import ContextVar
+from threading import Lock
+from time import monotonic
+
+from sqlmodel import Session, select
+
+from fob_api import engine
+from fob_api.config import Config
+from fob_api.metrics import record_cache_lookup
+from fob_api.models.database import Project, ProjectUserMembership
+
+
+class ProjectAccess:
+    """
+    Authorization decision of a user on a project
+    """
+
+    def __init__(self, project: Project, is_owner: bool, is_member: bool):
+        self.project = project
+        self.is_owner = is_owner
+        self.is_member = is_member
+
+
+class TTLCache:
+    """
+    Thread safe dict where entries expire after ttl seconds
+    """
+
+    def __init__(self, ttl: float, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: dict = {}
+        self._lock = Lock()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < monotonic():
+            self._data.pop(key, None)
+            return None
+        return value
+
+    def set(self, key, value) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if len(self._data) >= self.max_size:
+                now = monotonic()
+                self._data = {k: v for k, v in self._data.items() if v[0] >= now}
+                if len(self._data) >= self.max_size:
+                    self._data.clear()
+            self._data[key] = (monotonic() + self.ttl, value)
+
+    def invalidate(self, match) -> None:
+        """
+        Drop every entry where match(key) is True
+        """
+        with self._lock:
+            self._data = {k: v for k, v in self._data.items() if not match(k)}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class ProjectAccessCache:
+    """
+    Two tier cache of project authorization decisions keyed by (user_id, project_id)
+      - request tier: lives for one HTTP request (see request_scope)
+      - shared tier: process wide with a short TTL (AUTH_CACHE_TTL)
+    Invalidation only reach the current process, other workers rely on the TTL
+    """
+
+    def __init__(self, ttl: float):
+        self.shared = TTLCache(ttl)
+        self.request_scope: ContextVar[dict | None] = ContextVar("project_access_request_scope", default=None)
+
+    def get(self, user_id: int, project_id: int) -> ProjectAccess | None:
+        """
+        Return the access of a user on a project or None if the project does not exist
+        """
+        key = (user_id, project_id)
+        request_cache = self.request_scope.get()
+        if request_cache is not None and key in request_cache:
+            record_cache_lookup("project_access_request", True)
+            return request_cache[key]
+        if request_cache is not None:
+            record_cache_lookup("project_access_request", False)
+        access = self.shared.get(key)
+        record_cache_lookup("project_access_shared", access is not None)
+        if access is None:
+            access = self._load(user_id, project_id)
+            if access is not None:
+                self.shared.set(key, access)
+        if request_cache is not None and access is not None:
+            request_cache[key] = access
+        return access
+
+    def _load(self, user_id: int, project_id: int) -> ProjectAccess | None:
+        with Session(engine) as session:
+            row = session.exec(
+                select(Project, ProjectUserMembership.id)
+                .outerjoin(
+                    ProjectUserMembership,
+                    (ProjectUserMembership.project_id == Project.id) &
+                    (ProjectUserMembership.user_id == user_id)
+                )
+                .where(Project.id == project_id)
+            ).first()
+        if not row:
+            return None
+        project, membership_id = row
+        return ProjectAccess(project, project.owner_id == user_id, membership_id is not None)
+
+    def invalidate(self, project_id: int, user_id: int | None = None) -> None:
+        """
+        Drop cached decisions for a project, only for one user if user_id is given
+        """
+        match = lambda key: key[1] == project_id and (user_id is None or key[0] == user_id)
+        self.shared.invalidate(match)
+        request_cache = self.request_scope.get()
+        if request_cache is not None:
+            for key in [key for key in request_cache if match(key)]:
+                del request_cache[key]
+
+
+project_access_cache = ProjectAccessCache(Config().auth_cache_ttl)
@@ -14,6 +14,18 @@ def parse_bool(value: str) -> bool:
         return False
     raise ValueError(f"Value {value} is not recognized as a boolean use one of {list_of_true + list_of_false}")
 
+def parse_rate(value: str) -> tuple[int, int]:
+    """
+    Parse a rate limit written as "<requests>/<seconds>"
+    :param value: The value to parse e.g. "10/60"
+    :return: tuple (requests, seconds)
+    """
+    try:
+        requests, seconds = value.split("/")
+        return int(requests), int(seconds)
+    except ValueError:
+        raise ValueError(f"Value {value} is not recognized as a rate use <requests>/<seconds> e.g. 10/60")
+
 class SingletonMeta(type):
 
     _instances = {}
@@ -35,7 +47,12 @@ class Config(metaclass=SingletonMeta):
     celery_broker_url: str | None
     celery_result_backend: str | None
 
+    redis_url: str | None
+
     jwt_secret_key: str | None
+    jwt_stateless_access_tokens: bool | None
+    jwt_access_token_expire_minutes: int | None
+    auth_cache_ttl: float | None
 
     mail_server: str | None
     mail_port: int | None
@@ -56,6 +73,32 @@ class Config(metaclass=SingletonMeta):
 
     traefik_config_password: str | None
     traefik_host_ip: str | None
+    traefik_config_file: str | None
+
+    dns_check_concurrency: int | None
+    dns_check_timeout: float | None
+    dns_check_batch_size: int | None
+    dns_cache_redis: bool | None
+
+    retention_batch_size: int | None
+    retention_batch_sleep: float | None
+
+    rate_limit_backend: str | None
+    rate_limit_login: tuple[int, int] | None
+    rate_limit_password_reset: tuple[int, int] | None
+    rate_limit_device_register: tuple[int, int] | None
+
+    debug: bool | None
+    query_budget: int | None
+    query_repeat_threshold: int | None
+
+    worker_metrics_port: int | None
+    metrics_token: str | None
+
+    startup_validation: str | None
+    validation_timeout: float | None
+    validation_cache_ttl: int | None
+    validation_retry_interval: float | None
 
     def __init__(self):
         print("Initializing Config Singleton")
@@ -70,8 +113,14 @@ class Config(metaclass=SingletonMeta):
         self.headscale_token = environ.get("HEADSCALE_TOKEN")
         self.celery_broker_url = environ.get("CELERY_BROKER_URL")
         self.celery_result_backend = environ.get("CELERY_RESULT_BACKEND")
+        self.redis_url = environ.get("REDIS_URL") or self.celery_broker_url
 
         self.jwt_secret_key = environ.get("JWT_SECRET_KEY")
+        # when enabled only refresh tokens are stored in database, access tokens are short-lived and checked by signature
+        self.jwt_stateless_access_tokens = parse_bool(environ.get("JWT_STATELESS_ACCESS_TOKENS", "false"))
+        self.jwt_access_token_expire_minutes = int(environ.get("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+        # seconds a project authorization decision is shared between requests of a worker (0 to disable)
+        self.auth_cache_ttl = float(environ.get("AUTH_CACHE_TTL", "30"))
 
         self.mail_server = environ.get("MAIL_SERVER")
         self.mail_port = int(environ.get("MAIL_PORT", "587"))
@@ -92,6 +141,48 @@ class Config(metaclass=SingletonMeta):
 
         self.traefik_config_password = environ.get("TRAEFIK_CONFIG_PASSWORD")
         self.traefik_host_ip = environ.get("TRAEFIK_HOST_IP")
+        # optional path watched by the traefik file provider, the config is written there on every change
+        self.traefik_config_file = environ.get("TRAEFIK_CONFIG_FILE", "")
+
+        self.dns_check_concurrency = int(environ.get("DNS_CHECK_CONCURRENCY", "20"))
+        self.dns_check_timeout = float(environ.get("DNS_CHECK_TIMEOUT", "5"))
+        self.dns_check_batch_size = int(environ.get("DNS_CHECK_BATCH_SIZE", "500"))
+        self.dns_cache_redis = parse_bool(environ.get("DNS_CACHE_REDIS", "false"))
+
+        self.retention_batch_size = int(environ.get("RETENTION_BATCH_SIZE", "1000"))
+        self.retention_batch_sleep = float(environ.get("RETENTION_BATCH_SLEEP", "0.1"))
+
+        # "memory" is per process, use "redis" to share buckets between workers
+        self.rate_limit_backend = environ.get("RATE_LIMIT_BACKEND", "memory").lower()
+        self.rate_limit_login = parse_rate(environ.get("RATE_LIMIT_LOGIN", "10/60"))
+        self.rate_limit_password_reset = parse_rate(environ.get("RATE_LIMIT_PASSWORD_RESET", "5/300"))
+        self.rate_limit_device_register = parse_rate(environ.get("RATE_LIMIT_DEVICE_REGISTER", "10/60"))
+        if self.rate_limit_backend not in ["memory", "redis"]:
+            raise ValueError(f"RATE_LIMIT_BACKEND {self.rate_limit_backend} is not supported use memory or redis")
+
+        # debug adds a Server-Timing header with the query count and DB time of each request
+        self.debug = parse_bool(environ.get("DEBUG", "false"))
+        # requests running more queries than the budget are logged, with the statements repeated
+        # at least QUERY_REPEAT_THRESHOLD times (likely a query per row loop)
+        self.query_budget = int(environ.get("QUERY_BUDGET", "30"))
+        self.query_repeat_threshold = int(environ.get("QUERY_REPEAT_THRESHOLD", "5"))
+
+        # port of the prometheus exporter started by celery workers, 0 to disable
+        self.worker_metrics_port = int(environ.get("WORKER_METRICS_PORT", "9808"))
+        # bearer token required on the API /metrics endpoint, empty to leave it open
+        self.metrics_token = environ.get("METRICS_TOKEN", "")
+
+        # dependency checks when the API starts: "strict" refuses to start if one fails, "lazy" checks
+        # in the background and reports on /ready, "off" skips them
+        self.startup_validation = environ.get("STARTUP_VALIDATION", "strict").lower()
+        # seconds given to all the checks, they run concurrently
+        self.validation_timeout = float(environ.get("VALIDATION_TIMEOUT", "10"))
+        # seconds a successful validation is shared in redis with the other workers (0 to validate in every worker)
+        self.validation_cache_ttl = int(environ.get("VALIDATION_CACHE_TTL", "600"))
+        # seconds between two validations in lazy mode while they fail
+        self.validation_retry_interval = float(environ.get("VALIDATION_RETRY_INTERVAL", "30"))
+        if self.startup_validation not in ["strict", "lazy", "off"]:
+            raise ValueError(f"STARTUP_VALIDATION {self.startup_validation} is not supported use strict, lazy or off")
 
         ignore = ["MAIL_PASSWORD"]
 
@@ -154,12 +245,8 @@ class Config(metaclass=SingletonMeta):
     
     def validate_all(self) -> bool:
         """
-        Validate all credentials
+        Validate all credentials, concurrently and cached between workers (see fob_api.readiness)
         :return: True if all credentials are valid, False otherwise
         """
-        print("Validating all credentials")
-        return (
-            self.validate_openstack_credentials() and
-            self.validate_headscale_credentials() and
-            self.validate_email()
-        )
+        from fob_api import readiness
+        return readiness.validate()
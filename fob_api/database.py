@@ -1,8 +1,14 @@
+from functools import cache
+
 from fastapi import Depends, FastAPI, HTTPException, Query
+from redis import Redis
 from sqlmodel import Field, Session, SQLModel, create_engine, select
-from sqlalchemy import Engine
+from sqlalchemy import Engine, make_url
+from sqlalchemy.pool import QueuePool
 from sqlmodel import create_engine, SQLModel
 from fob_api import Config
+from fob_api import querystats
+from fob_api.metrics import TimedQueuePool, instrument_engine
 
 def init_engine() -> Engine:
     """
@@ -10,10 +16,26 @@ def init_engine() -> Engine:
     :return: Engine object
     """
     print("Initializing database engine")
-    return create_engine(Config().database_url, echo=False, pool_recycle=1800, pool_pre_ping=True)
+    database_url = make_url(Config().database_url)
+    # same pool as the dialect default, with checkout wait time measured when it is a QueuePool
+    pool_class = database_url.get_dialect().get_pool_class(database_url)
+    if pool_class is QueuePool:
+        pool_class = TimedQueuePool
+    engine = create_engine(database_url, echo=False, pool_recycle=1800, pool_pre_ping=True, poolclass=pool_class)
+    instrument_engine(engine)
+    querystats.instrument_engine(engine)
+    return engine
 
 engine = init_engine()
 
 def get_session():
     with Session(engine) as session:
         yield session
+
+@cache
+def get_redis() -> Redis:
+    """
+    Return the redis client shared by the process (rate limits, caches, locks)
+    :return: Redis client
+    """
+    return Redis.from_url(Config().redis_url)
@@ -0,0 +1,212 @@
+"""
+Generate a synthetic dataset at production scale, used by the benchmarks and to check query plans
+Rows are bulk inserted in chunks through the SQLModel tables and committed once
+
+Usage: python -m fob_api.dataset [--users 5000] [--ledger 50] [--projects 2000] [--members 20] [--shares 10]
+                                 [--groups 10] [--group-size 500] [--proxies 20000] [--create-tables]
+Ids continue after the rows already in the database, names must not collide (see --prefix)
+"""
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from random import Random
+from time import perf_counter
+
+from sqlalchemy import func
+from sqlmodel import Session, SQLModel, insert, select
+
+from fob_api import engine
+from fob_api.auth import hash_password, make_unusable_password
+from fob_api.models.database import (
+    HeadScalePolicyGroupMember,
+    Project,
+    ProjectUserMembership,
+    ProxyServiceMap,
+    QuotaType,
+    User,
+    UserQuota,
+    UserQuotaShare,
+)
+
+# group every synced user is added to (see tasks.core.sync_user)
+DEFAULT_GROUP = "cloud-edge"
+
+
+class DatasetGenerator:
+    """
+    Build and insert users, quota ledgers, projects, memberships, shares, headscale groups and proxies
+    The same seed gives the same dataset
+    """
+
+    def __init__(self, session: Session, prefix: str = "user", seed: int = 0, chunk_size: int = 5000):
+        """
+        :param prefix: users are named <prefix>-<n>, projects <prefix>-project-<n>
+        :param seed: seed of the random generator
+        :param chunk_size: max rows per insert statement
+        """
+        self.session = session
+        self.prefix = prefix
+        self.random = Random(seed)
+        self.chunk_size = chunk_size
+        self.now = datetime.now()
+
+    def insert(self, model: type[SQLModel], rows: list[dict]) -> int:
+        for start in range(0, len(rows), self.chunk_size):
+            self.session.exec(insert(model), params=rows[start:start + self.chunk_size])
+        return len(rows)
+
+    def next_id(self, model: type[SQLModel]) -> int:
+        return (self.session.exec(select(func.max(model.id))).one() or 0) + 1
+
+    def past(self, days: int = 365) -> datetime:
+        return self.now - timedelta(seconds=self.random.randrange(days * 86400))
+
+    def generate(
+            self,
+            users: int = 1000,
+            admins: int = 0,
+            password: str | None = None,
+            ledger: int = 20,
+            projects: int = 500,
+            members: int = 10,
+            shares: int = 5,
+            groups: int = 0,
+            group_size: int = 100,
+            proxies: int = 5000,
+            dns_failure_rate: float = 0.05,
+        ) -> dict[str, int]:
+        """
+        Insert the dataset without committing
+        :param users: users to create, the first admins are admins
+        :param password: password of every user (hashed once), unusable password if None
+        :param ledger: UserQuota adjustments of each user
+        :param members: members of each project besides its owner
+        :param shares: UserQuotaShare of each project, given by its owner or members
+        :param groups: headscale groups besides DEFAULT_GROUP (which has every user), group_size members each
+        :param dns_failure_rate: part of the proxies whose last DNS check failed (not served by traefik)
+        :return: rows inserted by table
+        """
+        types = list(QuotaType)
+        password_hash = hash_password(password) if password else None
+        first_user = self.next_id(User)
+        user_ids = list(range(first_user, first_user + users))
+        usernames = [f"{self.prefix}-{i}" for i in range(users)]
+        counts = {}
+
+        counts[User.__tablename__] = self.insert(User, [{
+            "id": user_id,
+            "username": username,
+            "email": f"{username}@laboinfra.net",
+            "password": password_hash or make_unusable_password(),
+            "is_admin": i < admins,
+            "disabled": False,
+            "last_synced": self.past(30),
+        } for i, (user_id, username) in enumerate(zip(user_ids, usernames))])
+
+        counts[UserQuota.__tablename__] = self.insert(UserQuota, [{
+            "user_id": user_id,
+            "type": self.random.choice(types),
+            # mostly grants with some withdrawals, like the adjustments made over a year
+            "quantity": self.random.choice((1, 2, 4, 8, 16)) * (-1 if self.random.random() < 0.2 else 1),
+            "comment": "generated",
+            "created_at": self.past(),
+        } for user_id in user_ids for _ in range(ledger)])
+
+        first_project = self.next_id(Project)
+        owners = [self.random.choice(user_ids) for _ in range(projects)] if users else []
+        counts[Project.__tablename__] = self.insert(Project, [{
+            "id": first_project + i,
+            "name": f"{self.prefix}-project-{i}",
+            "owner_id": owner_id,
+            "created_at": self.past(),
+        } for i, owner_id in enumerate(owners)])
+
+        project_members = {
+            first_project + i: [
+                user_id for user_id in self.random.sample(user_ids, min(members + 1, users)) if user_id != owner_id
+            ][:members]
+            for i, owner_id in enumerate(owners)
+        }
+        counts[ProjectUserMembership.__tablename__] = self.insert(ProjectUserMembership, [{
+            "project_id": project_id,
+            "user_id": user_id,
+            "created_at": self.past(),
+        } for project_id, member_ids in project_members.items() for user_id in member_ids])
+
+        counts[UserQuotaShare.__tablename__] = self.insert(UserQuotaShare, [{
+            "project_id": first_project + i,
+            "user_id": self.random.choice([owner_id] + project_members[first_project + i]),
+            "type": self.random.choice(types),
+            "quantity": self.random.choice((1, 2, 4)),
+            "comment": "generated",
+            "created_at": self.past(),
+        } for i, owner_id in enumerate(owners) for _ in range(shares)])
+
+        group_rows = [{"name": DEFAULT_GROUP, "member": username} for username in usernames]
+        for group in range(groups):
+            group_rows += [
+                {"name": f"{self.prefix}-group-{group}", "member": username}
+                for username in self.random.sample(usernames, min(group_size, users))
+            ]
+        counts[HeadScalePolicyGroupMember.__tablename__] = self.insert(HeadScalePolicyGroupMember, group_rows)
+
+        project_ids = list(project_members)
+        counts[ProxyServiceMap.__tablename__] = self.insert(ProxyServiceMap, [{
+            "project_id": self.random.choice(project_ids),
+            "rule": f"service-{i}.{self.prefix}.students.laboinfra.net",
+            "target": f"http://172.16.{i // 250 % 256}.{i % 250 + 1}:{self.random.choice((80, 443, 8080))}",
+            "created_at": self.past(),
+            "latest_dns_check": self.past(1),
+            "latest_dns_check_result": self.random.random() >= dns_failure_rate,
+            "next_check_at": self.now + timedelta(seconds=self.random.randrange(3600)),
+            "dns_check_failures": 0,
+        } for i in range(proxies if project_ids else 0)])
+        return counts
+
+
+def main() -> None:
+    """
+    Generate a dataset in the database of DATABASE_URL
+    """
+    parser = ArgumentParser(description="Bulk insert a synthetic dataset in the database of DATABASE_URL")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--admins", type=int, default=0, help="the first users are admins")
+    parser.add_argument("--password", help="password of every user, unusable password if not set")
+    parser.add_argument("--ledger", type=int, default=20, help="quota adjustments of each user")
+    parser.add_argument("--projects", type=int, default=500)
+    parser.add_argument("--members", type=int, default=10, help="members of each project")
+    parser.add_argument("--shares", type=int, default=5, help="quota shares of each project")
+    parser.add_argument("--groups", type=int, default=0, help=f"headscale groups besides {DEFAULT_GROUP}")
+    parser.add_argument("--group-size", type=int, default=100, help="members of each group")
+    parser.add_argument("--proxies", type=int, default=5000)
+    parser.add_argument("--dns-failure-rate", type=float, default=0.05)
+    parser.add_argument("--prefix", default="user", help="prefix of the generated names, change it to generate again")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=5000, help="max rows per insert statement")
+    parser.add_argument("--create-tables", action="store_true", help="create missing tables (scratch databases)")
+    args = parser.parse_args()
+
+    if args.create_tables:
+        SQLModel.metadata.create_all(engine)
+    start = perf_counter()
+    with Session(engine) as session:
+        counts = DatasetGenerator(session, args.prefix, args.seed, args.chunk_size).generate(
+            users=args.users,
+            admins=args.admins,
+            password=args.password,
+            ledger=args.ledger,
+            projects=args.projects,
+            members=args.members,
+            shares=args.shares,
+            groups=args.groups,
+            group_size=args.group_size,
+            proxies=args.proxies,
+            dns_failure_rate=args.dns_failure_rate,
+        )
+        session.commit()
+    for table, count in counts.items():
+        print(f"{table}: {count} rows")
+    print(f"Dataset generated in {perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
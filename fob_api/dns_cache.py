@@ -0,0 +1,143 @@
+"""
+DNS answer cache honoring record TTLs, shared by the DNS validation tasks
+"""
+import json
+from threading import Lock
+from time import perf_counter, time
+
+import dns.asyncresolver
+import dns.rdatatype
+import dns.resolver
+
+from fob_api import Config, get_redis
+from fob_api.metrics import observe_external_call, record_cache_lookup
+
+# negative answers without SOA in the authority section are kept this long
+DEFAULT_NEGATIVE_TTL = 60
+MAX_TTL = 60 * 60 * 24
+
+
+def negative_ttl(response) -> int:
+    """
+    TTL of a negative answer (RFC 2308): min of the SOA TTL and the SOA minimum field
+    """
+    if response is not None:
+        for rrset in response.authority:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                return min(rrset.ttl, rrset[0].minimum)
+    return DEFAULT_NEGATIVE_TTL
+
+
+async def timed_resolve(resolver: dns.asyncresolver.Resolver, name: str, rdtype: str = "A"):
+    """
+    resolver.resolve recorded as a call to the "dns" dependency
+    NXDOMAIN and NoAnswer are valid answers, their outcome is "negative" instead of "error"
+    """
+    start = perf_counter()
+    outcome = "error"
+    try:
+        answer = await resolver.resolve(name, rdtype)
+        outcome = "ok"
+        return answer
+    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+        outcome = "negative"
+        raise
+    finally:
+        observe_external_call("dns", rdtype, outcome, perf_counter() - start)
+
+
+class DNSCache:
+    """
+    Cache of resolved addresses keyed by (name, type)
+      - memory tier: per process, survives between task runs of a worker
+      - redis tier: optional (DNS_CACHE_REDIS) shared by all workers
+    A negative answer (NXDOMAIN, no record) is stored as an empty list
+    """
+
+    def __init__(self, use_redis: bool = False):
+        self.use_redis = use_redis
+        self._entries: dict[tuple[str, str], tuple[float, list[str]]] = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+    def redis_key(self, name: str, rdtype: str) -> str:
+        return f"fob:dns:{rdtype}:{name}"
+
+    def get(self, name: str, rdtype: str) -> list[str] | None:
+        """
+        :return: cached addresses, empty list for a cached negative answer, None on miss
+        """
+        key = (name.lower(), rdtype)
+        entry = self._entries.get(key)
+        if entry and entry[0] > time():
+            return entry[1]
+        if self.use_redis:
+            try:
+                redis = get_redis()
+                value = redis.get(self.redis_key(*key))
+                if value is not None:
+                    ttl = redis.ttl(self.redis_key(*key))
+                    addresses = json.loads(value)
+                    self._entries[key] = (time() + max(ttl, 0), addresses)
+                    return addresses
+            except Exception as e:
+                print(f"DNS cache redis error: {e}")
+        return None
+
+    def set(self, name: str, rdtype: str, addresses: list[str], ttl: float) -> None:
+        ttl = int(min(max(ttl, 0), MAX_TTL))
+        if ttl == 0:
+            return
+        key = (name.lower(), rdtype)
+        with self._lock:
+            now = time()
+            if len(self._entries) > 50000:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+            self._entries[key] = (now + ttl, addresses)
+        if self.use_redis:
+            try:
+                get_redis().set(self.redis_key(*key), json.dumps(addresses), ex=ttl)
+            except Exception as e:
+                print(f"DNS cache redis error: {e}")
+
+    async def resolve(self, resolver: dns.asyncresolver.Resolver, name: str, rdtype: str = "A") -> list[str]:
+        """
+        Resolve name through the cache
+        :return: addresses, empty list when the name or the record does not exist
+        Other resolution errors (timeouts...) are raised and not cached
+        """
+        addresses = self.get(name, rdtype)
+        record_cache_lookup("dns", addresses is not None)
+        if addresses is not None:
+            self.hits += 1
+            if not addresses:
+                self.negative_hits += 1
+            return addresses
+        self.misses += 1
+        try:
+            answer = await timed_resolve(resolver, name, rdtype)
+        except dns.resolver.NXDOMAIN as e:
+            responses = e.responses()
+            self.set(name, rdtype, [], negative_ttl(next(iter(responses.values()), None)))
+            return []
+        except dns.resolver.NoAnswer as e:
+            self.set(name, rdtype, [], negative_ttl(e.response()))
+            return []
+        addresses = [str(rdata) for rdata in answer]
+        self.set(name, rdtype, addresses, answer.expiration - time())
+        return addresses
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "size": len(self._entries),
+        }
+
+
+dns_cache = DNSCache(use_redis=Config().dns_cache_redis)
@@ -34,31 +34,31 @@ class User(BaseModel):
     created_at: str
 
     def list(self) -> List['User']:
-        server_reply = requests.get(f'{self.__path__}', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.get(f'{self.__path__}', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return [User(__driver__=self.__driver__, **user) for user in server_reply.json().get('users', [])]
 
     def create(self, name: str) -> 'User':
-        server_reply = requests.post(f'{self.__path__}', headers=self.__driver__.headers, json={'name': name})
+        server_reply = self.__driver__.session.post(f'{self.__path__}', headers=self.__driver__.headers, json={'name': name})
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return User(__driver__=self.__driver__, **server_reply.json()["user"])
 
     def get(self, name: str) -> 'User':
-        server_reply = requests.get(f'{self.__path__}/{name}', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.get(f'{self.__path__}/{name}', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return User(__driver__=self.__driver__, **server_reply.json()["user"])
 
     def rename(self, name: str, new_name: str) -> 'User':
-        server_reply = requests.post(f'{self.__path__}/{name}/rename/{new_name}', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.post(f'{self.__path__}/{name}/rename/{new_name}', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return User(__driver__=self.__driver__, **server_reply.json()["user"])
 
     def delete(self, name: str):
-        server_reply = requests.delete(f'{self.__path__}/{name}', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.delete(f'{self.__path__}/{name}', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return server_reply.json()
@@ -81,7 +81,7 @@ class PreAuthKey(BaseModel):
         return parse_datetime(self.expiration) < parse_datetime(datetime.now().strftime(DATE_FORMAT_STRPTIME)) or self.used
 
     def list(self, username) -> List['PreAuthKey']:
-        server_reply = requests.get(f'{self.__path__}?user={username}', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.get(f'{self.__path__}?user={username}', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return [PreAuthKey(__driver__=self.__driver__, **key) for key in server_reply.json().get('preAuthKeys', [])]
@@ -93,7 +93,7 @@ class PreAuthKey(BaseModel):
                ephemeral: bool = False,
                aclTags: List[str] = []
         ) -> 'PreAuthKey':
-        server_reply = requests.post(f'{self.__path__}', headers=self.__driver__.headers, json={
+        server_reply = self.__driver__.session.post(f'{self.__path__}', headers=self.__driver__.headers, json={
             'user': username,
             'reusable': reusable,
             'ephemeral': ephemeral,
@@ -103,7 +103,7 @@ class PreAuthKey(BaseModel):
         return PreAuthKey(__driver__=self.__driver__, **server_reply.json().get("preAuthKey"))
 
     def expire(self, username: str, key_value: str) -> dict:
-        server_reply = requests.post(f'{self.__path__}/expire', headers=self.__driver__.headers, json={'user': username, 'key': key_value})
+        server_reply = self.__driver__.session.post(f'{self.__path__}/expire', headers=self.__driver__.headers, json={'user': username, 'key': key_value})
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return server_reply.json()
@@ -139,49 +139,49 @@ class Node(BaseModel):
 
     def list(self, username: str = "") -> List['Node']:
         path = f'{self.__path__}' + (f'?user={username}' if username else '')
-        server_reply = requests.get(f'{path}', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.get(f'{path}', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return [Node(__driver__=self.__driver__, **node) for node in server_reply.json().get('nodes', [])]
 
     def get(self, id: str) -> 'Node':
-        server_reply = requests.get(f'{self.__path__}/{id}', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.get(f'{self.__path__}/{id}', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return Node(__driver__=self.__driver__, **server_reply.json().get('node', {}))
 
     def delete(self, id: str) -> dict:
-        server_reply = requests.delete(f'{self.__path__}/{id}', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.delete(f'{self.__path__}/{id}', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return server_reply.json()
     
     def register(self, name: str, mkey: str) -> 'Node':
-        server_reply = requests.post(f'{self.__path__}/register?user={name}&key={mkey}', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.post(f'{self.__path__}/register?user={name}&key={mkey}', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return Node(__driver__=self.__driver__, **server_reply.json().get('node', {}))
     
     def backfillips(self, confirmed: bool = False) -> List[str]:
-        server_reply = requests.post(f'{self.__path__}/backfillips?confirmed={str(confirmed).lower()}', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.post(f'{self.__path__}/backfillips?confirmed={str(confirmed).lower()}', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return server_reply.json().get("changes", [])
     
     def expire(self, id: str) -> 'Node':
-        server_reply = requests.post(f'{self.__path__}/{id}/expire', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.post(f'{self.__path__}/{id}/expire', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return Node(__driver__=self.__driver__, **server_reply.json().get('node', {}))
 
     def rename(self, id: str, new_name: str) -> 'Node':
-        server_reply = requests.post(f'{self.__path__}/{id}/rename/{new_name}', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.post(f'{self.__path__}/{id}/rename/{new_name}', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return Node(__driver__=self.__driver__, **server_reply.json().get('node', {}))
     
     def get_route(self, id: str) -> dict:
-        server_reply = requests.get(f'{self.__path__}/{id}/route', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.get(f'{self.__path__}/{id}/route', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         # Todo Return json until we have a Route model # Warning this will make a circular loop by making Route also depend on Node
@@ -189,13 +189,13 @@ class Node(BaseModel):
         return server_reply.json()
 
     def set_tags(self, id: str, tags: List[str]) -> 'Node':
-        server_reply = requests.post(f'{self.__path__}/{id}/tags', headers=self.__driver__.headers, json={'tags': tags})
+        server_reply = self.__driver__.session.post(f'{self.__path__}/{id}/tags', headers=self.__driver__.headers, json={'tags': tags})
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return Node(__driver__=self.__driver__, **server_reply.json().get('node', {}))
 
     def change_owner(self, id: str, username: str) -> 'Node':
-        server_reply = requests.post(f'{self.__path__}/{id}/user?user={username}', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.post(f'{self.__path__}/{id}/user?user={username}', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return Node(__driver__=self.__driver__, **server_reply.json().get('node', {}))
@@ -220,20 +220,20 @@ class Route(BaseModel):
             self.node = Node(__driver__=self.__driver__, **self.node)
 
     def list(self) -> List['Route']:
-        server_reply = requests.get(f'{self.__path__}', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.get(f'{self.__path__}', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return [Route(__driver__=self.__driver__, **route) for route in server_reply.json().get('routes', [])]
 
     def delete(self, router_id: str) -> dict:
-        server_reply = requests.delete(f'{self.__path__}/{router_id}', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.delete(f'{self.__path__}/{router_id}', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return server_reply.json()
 
     def set_status(self, router_id: str, active: bool) -> dict:
         path = f'{self.__path__}/{router_id}/' + ('enable' if active else 'disable')
-        server_reply = requests.post(f'{path}', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.post(f'{path}', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return server_reply.json()
@@ -368,7 +368,7 @@ class Policy(BaseModel):
             self.policy = PolicyData(**json.loads(kwargs['policy']))
 
     def get(self) -> 'Policy':
-        server_reply = requests.get(f'{self.__path__}', headers=self.__driver__.headers)
+        server_reply = self.__driver__.session.get(f'{self.__path__}', headers=self.__driver__.headers)
         if server_reply.status_code != 200:
             raise Exception(f'Error: {server_reply.status_code} - {server_reply.text}')
         return Policy(__driver__=self.__driver__, **server_reply.json())
@@ -380,7 +380,7 @@ class Policy(BaseModel):
         return json.dumps(policy_data.__dict__, default=lambda o: o.__dict__, sort_keys=True, indent=4)
     
     def update(self, policy_data: PolicyData) -> 'Policy':
-        server_reply = requests.put(
+        server_reply = self.__driver__.session.put(
             f'{self.__path__}',
             headers=self.__driver__.headers,
             json={
@@ -398,7 +398,9 @@ class HeadScale:
     route: Route
     policy: Policy
 
-    def __init__(self, server_url: str, api_key: str):
+    def __init__(self, server_url: str, api_key: str, session: requests.Session | None = None):
+        # one session for all calls so connections to the server are reused
+        self.session = session or requests.Session()
         # Remove trailing slash
         self.server_url = server_url
         if server_url[-1] == '/':
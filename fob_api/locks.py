@@ -0,0 +1,159 @@
+"""
+Distributed locks in redis to keep a single run of a task or of an operation on a key
+
+Usage:
+    @celery.task(name="...")
+    @single_flight("headscale:policy", ttl=120, rerun_if_skipped=True)
+    def update_headscale_policy(): ...
+
+    with Lease(f"project:{project.id}:quota", wait=30) as acquired:
+        ...
+"""
+from functools import wraps
+from threading import Event, Thread
+from typing import Callable
+
+from redis.exceptions import LockError, RedisError
+
+from fob_api import get_redis
+
+LOCK_PREFIX = "fob:lock:"
+
+
+class Lease:
+    """
+    Redis lock held for ttl seconds and renewed in the background while the holder runs,
+    a crashed holder releases it after at most ttl seconds
+    If redis is unavailable the lease is granted without lock (fail open)
+    """
+
+    def __init__(self, key: str, ttl: int = 60, wait: float = 0):
+        """
+        :param key: name of the locked resource, e.g. "user:bob:sync"
+        :param ttl: lease duration in seconds, renewed every ttl / 3
+        :param wait: seconds to wait for the lock, 0 to give up right away
+        """
+        self.key = LOCK_PREFIX + key
+        self.ttl = ttl
+        self.wait = wait
+        self._lock = None
+        self._stop = Event()
+        self._renewer: Thread | None = None
+
+    def acquire(self) -> bool:
+        try:
+            self._lock = get_redis().lock(
+                self.key,
+                timeout=self.ttl,
+                blocking=self.wait > 0,
+                blocking_timeout=self.wait or None,
+                thread_local=False,
+            )
+            if not self._lock.acquire():
+                self._lock = None
+                return False
+        except RedisError as e:
+            print(f"Lock backend error, {self.key} runs without lock: {e}")
+            self._lock = None
+            return True
+        self._stop.clear()
+        self._renewer = Thread(target=self._renew, name=f"lease-{self.key}", daemon=True)
+        self._renewer.start()
+        return True
+
+    def _renew(self) -> None:
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                self._lock.reacquire()
+            except (LockError, RedisError) as e:
+                print(f"Failed to renew lease {self.key}: {e}")
+                return
+
+    def release(self) -> None:
+        self._stop.set()
+        if self._renewer:
+            self._renewer.join()
+            self._renewer = None
+        if self._lock is None:
+            return
+        try:
+            self._lock.release()
+        except (LockError, RedisError) as e:
+            # lease expired and maybe taken by someone else, nothing to release
+            print(f"Failed to release lease {self.key}: {e}")
+        self._lock = None
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+def single_flight(
+        key: str | Callable[..., str],
+        ttl: int = 60,
+        wait: float = 0,
+        rerun_if_skipped: bool = False
+    ):
+    """
+    Decorator allowing only one run at a time of the function for a key, other calls are skipped (return None)
+    :param key: lock key or a function building it from the call arguments (per user/project locks)
+    :param ttl: lease duration in seconds, see Lease
+    :param wait: seconds to wait for a running call to finish before skipping
+    :param rerun_if_skipped: calls made while a run is in progress are coalesced into one more run
+        done by the holder once it finishes, for work that must see the latest state (e.g. policy push)
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            name = key(*args, **kwargs) if callable(key) else key
+            if not rerun_if_skipped:
+                with Lease(name, ttl, wait) as acquired:
+                    if acquired:
+                        return func(*args, **kwargs)
+                print(f"{func.__name__} already running for {name}, skipped")
+                return None
+            return run_coalesced(name, ttl, lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def run_coalesced(key: str, ttl: int, run: Callable):
+    """
+    Request a run and do it unless the lock holder will: the request flag is set before trying
+    the lock and checked by the holder after each run and after releasing, so no request is lost
+    If redis fails while holding the lock the holder runs once more without reading the flag (fail open)
+    """
+    redis = get_redis()
+    pending_key = LOCK_PREFIX + key + ":pending"
+    try:
+        redis.set(pending_key, 1, ex=ttl * 10)
+    except RedisError as e:
+        print(f"Lock backend error, {key} runs without lock: {e}")
+        return run()
+    result = None
+    while True:
+        lease = Lease(key, ttl)
+        if not lease.acquire():
+            print(f"{key} already running, run requested to the holder")
+            return result
+        try:
+            while True:
+                try:
+                    requested = redis.delete(pending_key)
+                except RedisError as e:
+                    print(f"Lock backend error, {key} runs once without coalescing: {e}")
+                    return run()
+                if not requested:
+                    break
+                result = run()
+        finally:
+            lease.release()
+        try:
+            if not redis.exists(pending_key):
+                return result
+        except RedisError as e:
+            # the last run started after the flag was read, only a request made since then is lost
+            print(f"Lock backend error, {key} not checked for new requests: {e}")
+            return result
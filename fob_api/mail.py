@@ -1,56 +1,167 @@
-from smtplib import SMTP
+from contextlib import contextmanager
+from queue import LifoQueue, Empty, Full
+from smtplib import SMTP, SMTPException, SMTPServerDisconnected
 from ssl import _create_unverified_context
 from email.mime.text import MIMEText
+from time import monotonic
 
 from jinja2 import Environment, FileSystemLoader
 
 from fob_api import Config
+from fob_api.metrics import track_external_call
 
 config = Config()
 
 # Ignore SSL certificate errors
 context = _create_unverified_context()
 
-jinja_engine = Environment(loader=FileSystemLoader('templates/mail'), autoescape=True)
-
 template_data_base = {
     "site_url": "https://docs.laboinfra.net",
     "site_name": "LaboInfra",
     "support_email": "contact@laboinfra.net",
 }
 
-def send_text_mail(receivers: str | list, subject: str, body: str):
+# templates are not edited at runtime, skip the mtime check done on every get_template
+jinja_engine = Environment(loader=FileSystemLoader('templates/mail'), autoescape=True, auto_reload=False, cache_size=-1)
+# base data is a global of the environment instead of being merged in every render call
+jinja_engine.globals.update(template_data_base)
+
+class SMTPPool:
     """
-        Send a text email
+    Keep SMTP connections open between messages (one handshake and login per connection)
+    Connections idle for more than check_after seconds are checked with NOOP before reuse
+    and replaced if the server closed them
     """
-    server = SMTP(config.mail_server, config.mail_port)
-    message = MIMEText(body, 'plain')
+
+    def __init__(self, size: int = 4, check_after: float = 30):
+        self.check_after = check_after
+        self._idle: LifoQueue = LifoQueue(maxsize=size)
+
+    def _connect(self) -> SMTP:
+        with track_external_call("smtp", "connect"):
+            server = SMTP(config.mail_server, config.mail_port, timeout=30)
+            if config.mail_starttls:
+                server.starttls(context=context)
+            if config.mail_password:
+                server.login(config.mail_username, config.mail_password)
+        return server
+
+    def _is_alive(self, server: SMTP) -> bool:
+        try:
+            return server.noop()[0] == 250
+        except (SMTPException, OSError):
+            return False
+
+    def _close(self, server: SMTP) -> None:
+        try:
+            server.quit()
+        except (SMTPException, OSError):
+            server.close()
+
+    def acquire(self) -> SMTP:
+        try:
+            server, released_at = self._idle.get_nowait()
+        except Empty:
+            return self._connect()
+        if monotonic() - released_at > self.check_after and not self._is_alive(server):
+            self._close(server)
+            return self._connect()
+        return server
+
+    def release(self, server: SMTP) -> None:
+        try:
+            self._idle.put_nowait((server, monotonic()))
+        except Full:
+            self._close(server)
+
+    def discard(self, server: SMTP) -> None:
+        """
+        Drop a borrowed connection that may be broken, it is closed without QUIT and never reused
+        """
+        try:
+            server.close()
+        except OSError:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection, it is dropped instead of returned to the pool if an error occurs
+        """
+        server = self.acquire()
+        try:
+            yield server
+        except BaseException:
+            self.discard(server)
+            raise
+        self.release(server)
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except Empty:
+                return
+            self._close(server)
+
+pool = SMTPPool()
+
+def build_message(receivers: str | list, subject: str, body: str, subtype: str = 'plain') -> MIMEText:
+    message = MIMEText(body, subtype)
     message['Subject'] = subject
     message['From'] = config.mail_sender
     message['To'] = receivers if isinstance(receivers, str) else ', '.join(receivers)
+    return message
+
+def send_message(server: SMTP, receivers: str | list, message: MIMEText):
+    """
+        Send a built message on an open connection
+    """
+    with track_external_call("smtp", "send"):
+        server.sendmail(config.mail_sender, receivers, message.as_string())
 
-    if config.mail_starttls:
-        server.starttls(context=context)
-    if config.mail_password:
-        server.login(config.mail_username, config.mail_password)
+def deliver(receivers: str | list, message: MIMEText):
+    """
+        Send a built message through the connection pool
+        a connection closed by the server is replaced once before giving up
+    """
+    try:
+        with pool.connection() as server:
+            send_message(server, receivers, message)
+    except SMTPServerDisconnected:
+        with pool.connection() as server:
+            send_message(server, receivers, message)
 
-    server.sendmail(config.mail_sender, receivers, message.as_string())
-    server.quit()
+def preload_templates() -> list[str]:
+    """
+        Compile every mail template so the first mails sent do not pay for it
+        :return: names of the loaded templates
+    """
+    names = jinja_engine.list_templates(extensions=["j2"])
+    for name in names:
+        jinja_engine.get_template(name)
+    return names
 
-def send_mail(receivers: str | list, subject: str, template: str, template_data: dict):
+def render_mail(template: str, template_data: dict) -> str:
+    return jinja_engine.get_template(template).render(template_data)
+
+def render_batch(template: str, template_data: list[dict]) -> list[str]:
     """
-        Send an email using the given template and data
+        Render one template for many recipients
+        :param template_data: per message data, base data is provided by the environment
+        :return: rendered bodies in the same order
     """
-    server = SMTP(config.mail_server, config.mail_port)
-    message = MIMEText(jinja_engine.get_template(template).render({**template_data_base, **template_data}), 'html')
-    message['Subject'] = subject
-    message['From'] = config.mail_sender
-    message['To'] = receivers if isinstance(receivers, str) else ', '.join(receivers)
+    compiled = jinja_engine.get_template(template)
+    return [compiled.render(data) for data in template_data]
 
-    if config.mail_starttls:
-        server.starttls(context=context)
-    if config.mail_password:
-        server.login(config.mail_username, config.mail_password)
+def send_text_mail(receivers: str | list, subject: str, body: str):
+    """
+        Send a text email
+    """
+    deliver(receivers, build_message(receivers, subject, body, 'plain'))
 
-    server.sendmail(config.mail_sender, receivers, message.as_string())
-    server.quit()
+def send_mail(receivers: str | list, subject: str, template: str, template_data: dict):
+    """
+        Send an email using the given template and data
+    """
+    deliver(receivers, build_message(receivers, subject, render_mail(template, template_data), 'html'))
@@ -1,17 +1,92 @@
+from contextlib import asynccontextmanager
+from os import getpid
+from time import perf_counter
+
 from fastapi import FastAPI
-from fob_api import Config
+from fob_api import Config, readiness
 
-if not Config().validate_all():
+if not readiness.validate_at_startup():
     raise ValueError("Invalid configuration. Please check your environment variables.")
 
-from fob_api import engine, routes
+from fob_api import engine, routes, auth, metrics, querystats
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    metrics.mark_process_dead(getpid())
 
 app = FastAPI(
+    lifespan=lifespan,
     swagger_ui_parameters={
         "persistAuthorization": True,
     }
 )
 
+@app.middleware("http")
+async def request_metrics(request, call_next):
+    """Record latency by route template and the number of requests in progress"""
+    method = request.method
+    metrics.http_requests_in_progress.labels(method).inc()
+    start = perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # route is set in the scope by the router, unmatched paths share one label
+        route = request.scope.get("route")
+        metrics.http_request_duration.labels(
+            method, route.path if route else "unmatched", str(status)
+        ).observe(perf_counter() - start)
+        metrics.http_requests_in_progress.labels(method).dec()
+
+@app.middleware("http")
+async def project_access_request_scope(request, call_next):
+    """Give each request its own tier of the project authorization cache"""
+    token = auth.project_access_cache.request_scope.set({})
+    try:
+        return await call_next(request)
+    finally:
+        auth.project_access_cache.request_scope.reset(token)
+
+@app.middleware("http")
+async def query_stats(request, call_next):
+    """
+    Count the queries of the request, log it when over budget or when a statement repeats
+    The stats are reported once the body is sent so the queries of a streamed body (e.g. /users/export)
+    are counted, the Server-Timing header only covers the queries run before the body starts
+    """
+    config = Config()
+    with querystats.count_queries() as stats:
+        response = await call_next(request)
+    route = request.scope.get("route")
+    route_path = route.path if route else request.url.path
+    if config.debug:
+        response.headers["Server-Timing"] = f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"'
+
+    def report() -> None:
+        repeated = stats.repeated(config.query_repeat_threshold)
+        if stats.count > config.query_budget or repeated:
+            print(f"{request.method} {route_path}: {stats.count} queries in {stats.duration * 1000:.1f}ms "
+                  f"(budget {config.query_budget})")
+            for statement, count in repeated[:3]:
+                print(f"  repeated {count} times: {' '.join(statement.split())[:200]}")
+        querystats.request_finished(f"{request.method} {route_path}", stats)
+
+    body = response.body_iterator
+
+    async def body_then_report():
+        # the body runs in the app task, whose context still holds stats
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            report()
+
+    response.body_iterator = body_then_report()
+    return response
+
 app.include_router(routes.status_router)
 app.include_router(routes.token_router)
 app.include_router(routes.users_router)
@@ -20,3 +95,4 @@ app.include_router(routes.headscale_router)
 app.include_router(routes.openstack_router)
 app.include_router(routes.quota_router)
 app.include_router(routes.proxy_router)
+app.include_router(routes.metrics_router)
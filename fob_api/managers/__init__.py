@@ -1,2 +1,4 @@
 from .openstack_manager import OpenStackManager
 from .proxy_manager import ProxyManager
+from .retention_manager import RetentionManager
+from .user_manager import UserManager
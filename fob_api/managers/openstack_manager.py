@@ -1,6 +1,6 @@
 from fob_api.config import Config
+from fob_api.openstack import InstrumentedSession
 from keystoneauth1.identity import v3
-from keystoneauth1 import session
 from keystoneclient.v3 import client as keystone_client
 from novaclient import client as nova_client
 from neutronclient.v2_0 import client as neutron_client
@@ -25,7 +25,7 @@ class OpenStackManager:
         Build a session for OpenStack authentication.
         :return: A session object for OpenStack authentication.
         """
-        return session.Session(auth=v3.Password(
+        return InstrumentedSession(auth=v3.Password(
             auth_url=self.config.os_auth_url,
             username=self.config.os_username,
             password=self.config.os_password,
@@ -1,10 +1,30 @@
-from sqlmodel import Session, select
+from copy import deepcopy
+from datetime import datetime
+from threading import Lock
+from time import time
 import base64
+import json
+
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, delete, insert, select
+
+from fob_api import get_redis
+from fob_api.config import Config
+from fob_api.metrics import record_cache_lookup
 from fob_api.models.database import ProxyServiceMap, Project
 
 class ProxyManager:
 
+    # redis key holding the version of the traefik config shared by all workers
+    config_version_key = "fob:traefik:config_version"
+    # last rendered traefik config of this process, reused while the version does not change
+    _rendered_version = None
+    _rendered_body = None
+    _render_lock = Lock()
+
     session = None
+    # template only, never mutate it (build_treafik_config works on a deep copy)
     default_traefik_config = {
         "http": {
             "routers": {},
@@ -48,59 +68,203 @@ class ProxyManager:
         if session:
             self.session = session
     
-    def build_treafik_config(self):
-        # loop over all ProxyServiceMap entries and build the Traefik config
-        proxy_service_maps = self.session.exec(select(ProxyServiceMap).where(ProxyServiceMap.latest_dns_check_result == True)).all()
-        if not proxy_service_maps:
-            return self.default_traefik_config
-        new_maps = self.default_traefik_config.copy()
-        for service in proxy_service_maps:
-            project = self.session.get(Project, service.project_id)
-            if not project:
-                continue
-            uniq_name = f"{base64.b64encode(service.rule.encode()).decode()}".replace("=", "")[5:25]
-            uniq_name = f"{project.name}-{uniq_name}"
-            new_maps["http"]["routers"][uniq_name+"-http"] = {
+    def build_treafik_config(self) -> dict:
+        """
+        Build the Traefik config from all proxies with a passing DNS check
+        Proxies and their project name are fetched in one query and added to a fresh copy of the template
+        """
+        new_maps = deepcopy(self.default_traefik_config)
+        routers = new_maps["http"]["routers"]
+        services = new_maps["http"]["services"]
+        proxy_service_maps = self.session.exec(
+            select(ProxyServiceMap.rule, ProxyServiceMap.target, Project.name)
+            .join(Project, Project.id == ProxyServiceMap.project_id)
+            .where(ProxyServiceMap.latest_dns_check_result == True)
+        ).all()
+        for rule, target, project_name in proxy_service_maps:
+            uniq_name = f"{base64.b64encode(rule.encode()).decode()}".replace("=", "")[5:25]
+            uniq_name = f"{project_name}-{uniq_name}"
+            service_name = f"{uniq_name}-service"
+            routers[uniq_name+"-http"] = {
                 "entrypoints": "web",
-                "rule": "Host(`{}`)".format(service.rule),
+                "rule": f"Host(`{rule}`)",
                 "middlewares": ["https-redirect"],
-                "service": "{}-service".format(uniq_name),
+                "service": service_name,
             }
-            new_maps["http"]["routers"][uniq_name+"-https"] = {
+            routers[uniq_name+"-https"] = {
                 "entrypoints": "websecure",
-                "rule": "Host(`{}`)".format(service.rule),
-                "service": "{}-service".format(uniq_name),
+                "rule": f"Host(`{rule}`)",
+                "service": service_name,
                 "tls": { "certResolver": "certificateResolver" }
             }
-            new_maps["http"]["services"]["{}-service".format(uniq_name)] = {
+            services[service_name] = {
                 "loadBalancer": {
-                    "servers": [
-                        {"url": "".format(service.target)}
-                    ],
+                    "servers": [{"url": url} for url in target.split(",")],
                     "passHostHeader": True,
                 }
             }
         return new_maps
-    
+
+    def get_config_version(self) -> int | None:
+        """
+        Get the current version of the traefik config
+        :return: version or None if it cannot be read (cache is then bypassed)
+        """
+        try:
+            redis = get_redis()
+            # start from a timestamp so a reset of redis never reuses an old version
+            redis.set(self.config_version_key, int(time() * 1000), nx=True)
+            return int(redis.get(self.config_version_key))
+        except Exception as e:
+            print(f"Cannot read traefik config version: {e}")
+            return None
+
+    def bump_config_version(self) -> None:
+        """
+        Invalidate the rendered traefik config in all workers
+        Must be called after any change of the active proxies
+        """
+        try:
+            redis = get_redis()
+            redis.set(self.config_version_key, int(time() * 1000), nx=True)
+            redis.incr(self.config_version_key)
+        except Exception as e:
+            print(f"Cannot bump traefik config version: {e}")
+        self.publish_config()
+
+    def publish_config(self) -> None:
+        """
+        Push the new traefik config to the file provider if TRAEFIK_CONFIG_FILE is set
+        The file is written by a worker so the api does not need access to the traefik volume
+        """
+        if not Config().traefik_config_file:
+            return
+        # import here to avoid circular import (tasks use this manager)
+        from fob_api.tasks.proxy import publish_traefik_config
+        try:
+            publish_traefik_config.delay()
+        except Exception as e:
+            print(f"Cannot enqueue traefik config publication: {e}")
+
+    def render_traefik_config(self, version: int | None = None) -> bytes:
+        """
+        Return the traefik config serialized as json
+        The rendered bytes are kept in memory and reused while version does not change
+        """
+        if version is None:
+            return json.dumps(self.build_treafik_config()).encode()
+        cls = type(self)
+        with cls._render_lock:
+            record_cache_lookup("traefik_config", cls._rendered_version == version)
+            if cls._rendered_version != version:
+                cls._rendered_body = json.dumps(self.build_treafik_config()).encode()
+                cls._rendered_version = version
+            return cls._rendered_body
+
     def create_proxy(self, project: Project, rule: str, target: str):
         """
         Create a new proxy service map.
         """
-        # check if not already exists
-        existing_proxy = self.session.exec(
+        return self.bulk_create_proxies([(project.id, rule, target)])[0]
+
+    def find_existing(self, entries: list[tuple[int, str, str]]) -> dict[tuple[int, str, str], ProxyServiceMap]:
+        """
+        :param entries: list of (project_id, rule, target)
+        :return: (project_id, rule, target) -> proxy of the entries already in the database
+        """
+        if not entries:
+            return {}
+        proxies = self.session.exec(
             select(ProxyServiceMap).where(
-                (ProxyServiceMap.project_id == project.id) &
-                (ProxyServiceMap.rule == rule) &
-                (ProxyServiceMap.target == target)
+                tuple_(ProxyServiceMap.project_id, ProxyServiceMap.rule, ProxyServiceMap.target).in_(entries)
             )
-        ).first()
-        if existing_proxy:
-            return existing_proxy
-        new_proxy = ProxyServiceMap(project_id=project.id, rule=rule, target=target)
-        self.session.add(new_proxy)
+        ).all()
+        return {(proxy.project_id, proxy.rule, proxy.target): proxy for proxy in proxies}
+
+    def bulk_create_proxies(self, entries: list[tuple[int, str, str]]) -> list[ProxyServiceMap]:
+        """
+        Create many proxy service maps at once, existing (project_id, rule, target) are kept as is
+        The existing entries are selected first and the others inserted in a single statement,
+        the traefik config and the DNS checks are only updated when a proxy is created
+        :param entries: list of (project_id, rule, target)
+        :return: the proxies matching entries, created or already existing
+        """
+        entries = list(dict.fromkeys(entries))
+        existing = self.find_existing(entries)
+        missing = [entry for entry in entries if entry not in existing]
+        while missing:
+            now = datetime.now()
+            try:
+                self.session.exec(insert(ProxyServiceMap), params=[
+                    {"project_id": project_id, "rule": rule, "target": target, "created_at": now}
+                    for project_id, rule, target in missing
+                ])
+                self.session.commit()
+                break
+            except IntegrityError:
+                # an entry was created concurrently since the select, insert the others again
+                self.session.rollback()
+                existing = self.find_existing(missing)
+                if not existing:
+                    raise
+                missing = [entry for entry in missing if entry not in existing]
+        proxies = self.find_existing(entries)
+        # missing now holds the created entries
+        if missing:
+            self.bump_config_version()
+            self.enqueue_dns_checks([rule for _, rule, _ in missing])
+        return [proxies[entry] for entry in entries]
+
+    def bulk_delete_proxies(self, proxies: list[ProxyServiceMap]) -> int:
+        """
+        Delete many proxy service maps in one statement
+        :return: number of deleted proxies
+        """
+        if not proxies:
+            return 0
+        result = self.session.exec(delete(ProxyServiceMap).where(ProxyServiceMap.id.in_([proxy.id for proxy in proxies])))
         self.session.commit()
-        return new_proxy
-    
+        self.bump_config_version()
+        return result.rowcount
+
+    def dns_check_pending_key(self, rule: str) -> str:
+        return f"fob:dns:pending:{rule}"
+
+    def enqueue_dns_check(self, rule: str) -> None:
+        """
+        Enqueue an immediate DNS check of a rule, only one check per rule can be pending
+        """
+        self.enqueue_dns_checks([rule])
+
+    def enqueue_dns_checks(self, rules: list[str]) -> None:
+        """
+        Enqueue one task checking right away all rules that have no check pending
+        """
+        # import here to avoid circular import (tasks use this manager)
+        from fob_api.tasks.dns_cmd import validate_proxy_domains
+        pending = []
+        for rule in dict.fromkeys(rules):
+            try:
+                # the key expires by itself if the task is lost
+                if not get_redis().set(self.dns_check_pending_key(rule), 1, nx=True, ex=300):
+                    print(f"DNS check already pending for {rule}")
+                    continue
+            except Exception as e:
+                print(f"Cannot deduplicate DNS check for {rule}: {e}")
+            pending.append(rule)
+        if not pending:
+            return
+        try:
+            validate_proxy_domains.delay(pending)
+        except Exception as e:
+            print(f"Cannot enqueue DNS check for {pending}, left to the periodic check: {e}")
+
+    def release_dns_check(self, rule: str) -> None:
+        try:
+            get_redis().delete(self.dns_check_pending_key(rule))
+        except Exception as e:
+            print(f"Cannot release DNS check for {rule}: {e}")
+
     def get_proxy_by_project(self, project: Project):
         """
         Get all proxy service maps for a given project.
@@ -120,6 +284,7 @@ class ProxyManager:
         """    
         self.session.delete(proxy)
         self.session.commit()
+        self.bump_config_version()
         return True
     
     def validate_targets(self, targets: list[str]) -> bool:
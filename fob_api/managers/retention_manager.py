@@ -0,0 +1,77 @@
+from datetime import datetime
+from time import monotonic, sleep
+
+from sqlmodel import Session, SQLModel, select, delete
+
+from fob_api.config import Config
+from fob_api.models.database import Token, UserPasswordReset
+
+
+class RetentionManager:
+    """
+    Purge expired rows from time-bounded tables with chunked set-based deletes
+    """
+
+    session = None
+    config = None
+
+    # table name -> (model, column holding the expiration date)
+    policies = {
+        "token": (Token, Token.expires_at),
+        "userpasswordreset": (UserPasswordReset, UserPasswordReset.expires_at),
+    }
+
+    def __init__(self, session: Session, batch_size: int | None = None, batch_sleep: float | None = None):
+        """
+        Initialize the RetentionManager with a database session.
+        :param batch_size: max rows deleted per statement, default from config
+        :param batch_sleep: seconds to wait between two chunks, default from config
+        """
+        self.session = session
+        self.config = Config()
+        self.batch_size = batch_size or self.config.retention_batch_size
+        self.batch_sleep = self.config.retention_batch_sleep if batch_sleep is None else batch_sleep
+
+    def purge(self, model: type[SQLModel], column, before: datetime) -> int:
+        """
+        Delete all rows of model where column is older than before
+        Each chunk selects a batch of ids then deletes them in one statement and commits
+        :return: number of deleted rows
+        """
+        deleted = 0
+        while True:
+            ids = self.session.exec(select(model.id).where(column < before).limit(self.batch_size)).all()
+            if not ids:
+                break
+            self.session.exec(delete(model).where(model.id.in_(ids)))
+            self.session.commit()
+            deleted += len(ids)
+            if len(ids) < self.batch_size:
+                break
+            if self.batch_sleep:
+                sleep(self.batch_sleep)
+        return deleted
+
+    def purge_table(self, table: str, before: datetime | None = None) -> int:
+        """
+        Purge expired rows of a table registered in policies
+        """
+        if table not in self.policies:
+            raise ValueError(f"No retention policy for table {table} use one of {list(self.policies)}")
+        model, column = self.policies[table]
+        return self.purge(model, column, before or datetime.now())
+
+    def purge_all(self, before: datetime | None = None) -> dict:
+        """
+        Purge expired rows of every table registered in policies
+        :return: count of deleted rows per table and total duration in seconds
+        """
+        before = before or datetime.now()
+        start = monotonic()
+        report = {}
+        for table in self.policies:
+            table_start = monotonic()
+            report[table] = self.purge_table(table, before)
+            print(f"Purged {report[table]} expired rows from {table} in {monotonic() - table_start:.2f}s")
+        report["duration"] = round(monotonic() - start, 3)
+        return report
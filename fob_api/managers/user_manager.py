@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select, insert, or_
+
+from fob_api.auth import make_unusable_password
+from fob_api.models.database import User, UserPasswordReset
+
+
+class UserManager:
+    """
+    Set-based operations on users, used by the bulk import
+    """
+
+    session = None
+
+    def __init__(self, session: Session, chunk_size: int = 1000):
+        """
+        Initialize the UserManager with a database session.
+        :param chunk_size: max rows per insert statement
+        """
+        self.session = session
+        self.chunk_size = chunk_size
+
+    def find_existing(self, usernames: list[str], emails: list[str]) -> tuple[set[str], set[str]]:
+        """
+        Look up in one query which usernames and emails are already taken
+        :return: (taken usernames, taken emails)
+        """
+        rows = self.session.exec(
+            select(User.username, User.email)
+            .where(or_(User.username.in_(usernames), User.email.in_(emails)))
+        ).all()
+        return {username for username, _ in rows}, {email for _, email in rows}
+
+    def bulk_create_users(
+            self,
+            users: list[tuple[str, str]],
+            reset_valid_for: timedelta
+        ) -> tuple[list[tuple[str, str, str]], list[tuple[str, str]]]:
+        """
+        Insert users with an unusable password and a password reset token each, committed by chunk
+        :param users: list of (username, email), checked with find_existing beforehand
+        :param reset_valid_for: validity of the reset token sent in the welcome mail
+        :return: (list of (username, email, reset token) created,
+                  list of (username, email) skipped because created concurrently since the check)
+        """
+        created, skipped = [], []
+        for start in range(0, len(users), self.chunk_size):
+            chunk = users[start:start + self.chunk_size]
+            while chunk:
+                try:
+                    tokens = self._insert_chunk(chunk, reset_valid_for)
+                    self.session.commit()
+                except IntegrityError:
+                    # a user was created between find_existing and the insert, retry the chunk without it
+                    self.session.rollback()
+                    taken_usernames, taken_emails = self.find_existing(
+                        [username for username, _ in chunk], [email for _, email in chunk]
+                    )
+                    conflicts = [
+                        (username, email) for username, email in chunk
+                        if username in taken_usernames or email in taken_emails
+                    ]
+                    if not conflicts:
+                        raise
+                    skipped.extend(conflicts)
+                    chunk = [row for row in chunk if row not in conflicts]
+                    continue
+                created.extend((username, email, token) for (username, email), token in zip(chunk, tokens))
+                break
+        return created, skipped
+
+    def _insert_chunk(self, chunk: list[tuple[str, str]], reset_valid_for: timedelta) -> list[str]:
+        """
+        Insert the users of chunk and their reset tokens without committing
+        :return: reset tokens in the order of chunk
+        """
+        now = datetime.now()
+        self.session.exec(insert(User), params=[
+            {
+                "username": username,
+                "email": email,
+                "password": make_unusable_password(),
+                "is_admin": False,
+                "disabled": False,
+                "last_synced": now,
+            }
+            for username, email in chunk
+        ])
+        ids = dict(self.session.exec(
+            select(User.username, User.id).where(User.username.in_([username for username, _ in chunk]))
+        ).all())
+        tokens = [str(uuid4()) for _ in chunk]
+        self.session.exec(insert(UserPasswordReset), params=[
+            {
+                "user_id": ids[username],
+                "token": token,
+                "source_ip": "",
+                "created_at": now,
+                "expires_at": now + reset_valid_for,
+            }
+            for (username, _), token in zip(chunk, tokens)
+        ])
+        return tokens
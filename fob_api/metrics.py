@@ -0,0 +1,205 @@
+"""
+Prometheus metrics shared by the API and the Celery workers
+
+With several processes (celery prefork children, uvicorn workers) PROMETHEUS_MULTIPROC_DIR
+must be set before start, every process then writes its samples in that directory and
+the exporter aggregates them (see get_registry).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os import environ
+from time import perf_counter
+from urllib.parse import urlparse
+import re
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from requests import Session as RequestsSession
+from sqlalchemy import Engine, event
+from sqlalchemy.pool import QueuePool
+
+TASK_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, float("inf"))
+
+task_duration = Histogram(
+    "fob_celery_task_duration_seconds", "Duration of Celery tasks", ["task", "state"], buckets=TASK_BUCKETS
+)
+task_retries = Counter("fob_celery_task_retries_total", "Retries of Celery tasks", ["task"])
+task_failures = Counter("fob_celery_task_failures_total", "Failed Celery tasks", ["task", "exception"])
+task_external_seconds = Counter(
+    "fob_celery_task_external_seconds_total", "Time spent by tasks waiting on a dependency", ["task", "dependency"]
+)
+task_external_calls = Counter(
+    "fob_celery_task_external_calls_total", "Calls made by tasks to a dependency", ["task", "dependency"]
+)
+external_call_duration = Histogram(
+    "fob_external_call_duration_seconds",
+    "Latency of calls to external dependencies (headscale, keystone, nova, cinder, smtp, dns, database)",
+    ["dependency", "operation", "outcome"],
+)
+
+http_request_duration = Histogram(
+    "fob_http_request_duration_seconds", "Latency of API requests", ["method", "route", "status"]
+)
+http_requests_in_progress = Gauge(
+    "fob_http_requests_in_progress", "API requests being served", ["method"], multiprocess_mode="livesum"
+)
+db_pool_checkouts = Counter("fob_db_pool_checkouts_total", "Connections checked out of the pool")
+db_pool_wait = Histogram(
+    "fob_db_pool_wait_seconds", "Time waited for a pool connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, float("inf"))
+)
+db_pool_checked_out = Gauge(
+    "fob_db_pool_checked_out", "Connections currently checked out", multiprocess_mode="livesum"
+)
+db_pool_overflow = Gauge(
+    "fob_db_pool_overflow", "Connections open above the pool size", multiprocess_mode="livesum"
+)
+cache_requests = Counter("fob_cache_requests_total", "Cache lookups by cache and result (hit, miss)", ["cache", "result"])
+
+# name of the celery task running in this thread, remote calls are attributed to it
+current_task: ContextVar[str | None] = ContextVar("current_task", default=None)
+
+
+def observe_external_call(dependency: str, operation: str, outcome: str, duration: float) -> None:
+    external_call_duration.labels(dependency, operation, outcome).observe(duration)
+    task = current_task.get()
+    if task:
+        task_external_seconds.labels(task, dependency).inc(duration)
+        task_external_calls.labels(task, dependency).inc()
+
+
+@contextmanager
+def track_external_call(dependency: str, operation: str):
+    """
+    Time the block as a call to a dependency, outcome is "error" if it raises
+    """
+    start = perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        observe_external_call(dependency, operation, outcome, perf_counter() - start)
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    cache_requests.labels(cache, "hit" if hit else "miss").inc()
+
+
+VERSION_SEGMENT = re.compile(r"^v\d+(\.\d+)?$")
+
+
+def url_operation(method: str, url: str) -> str:
+    """
+    Low cardinality operation name of an http call: method and first resource of the path
+    e.g. GET /api/v1/user/bob -> "GET user"
+    """
+    for segment in urlparse(url).path.split("/"):
+        if segment and segment != "api" and not VERSION_SEGMENT.match(segment):
+            return f"{method.upper()} {segment}"
+    return method.upper()
+
+
+class InstrumentedHTTPSession(RequestsSession):
+    """
+    requests session timing every call as a call to dependency
+    """
+
+    def __init__(self, dependency: str):
+        super().__init__()
+        self.dependency = dependency
+
+    def request(self, method, url, *args, **kwargs):
+        with track_external_call(self.dependency, url_operation(method, url)):
+            return super().request(method, url, *args, **kwargs)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info["query_start"].pop()
+    observe_external_call("database", statement.split(None, 1)[0].upper(), "ok", perf_counter() - start)
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is None or not conn.info.get("query_start"):
+        return
+    start = conn.info["query_start"].pop()
+    statement = exception_context.statement or "UNKNOWN"
+    observe_external_call("database", statement.split(None, 1)[0].upper(), "error", perf_counter() - start)
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool recording how long a checkout waited for a free connection
+    """
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_wait.observe(perf_counter() - start)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Time every statement run on engine as a call to the "database" dependency
+    and follow the connection pool usage
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+    pool = engine.pool
+
+    def overflow() -> int:
+        return max(pool.overflow(), 0) if isinstance(pool, QueuePool) else 0
+
+    @event.listens_for(pool, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        db_pool_checkouts.inc()
+        db_pool_checked_out.inc()
+        db_pool_overflow.set(overflow())
+
+    @event.listens_for(pool, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        db_pool_checked_out.dec()
+        db_pool_overflow.set(overflow())
+
+
+def get_registry() -> CollectorRegistry:
+    """
+    Registry to export, aggregated over all processes in multiprocess mode
+    """
+    if environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def mark_process_dead(pid: int) -> None:
+    """
+    Drop the live gauges of an exited process from the aggregation (multiprocess mode only)
+    """
+    if environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+
+def render_latest() -> tuple[bytes, str]:
+    """
+    :return: metrics in the prometheus text format and its content type
+    """
+    return generate_latest(get_registry()), CONTENT_TYPE_LATEST
@@ -13,6 +13,7 @@ from .headscale import (
     HeadScalePolicyHostCreate
 )
 from .sync import SyncInfo
+from .status import Readiness
 from .user import (
     Me,
     UserInfo,
@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+class Readiness(BaseModel):
+    status: str
+    checks: dict[str, str]
+    validated_at: str | None
+    cached: bool
@@ -3,6 +3,7 @@ from pydantic import BaseModel
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
 
 class TokenValidate(BaseModel):
     valid: bool
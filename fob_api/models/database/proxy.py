@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlmodel import Field, SQLModel
+from sqlmodel import Field, SQLModel, UniqueConstraint
 
 class ProxyServiceMapCreate(SQLModel):
     project_id: int = Field(foreign_key="openstack_project.id", nullable=False)
@@ -11,11 +11,16 @@ class ProxyServiceMap(ProxyServiceMapCreate, table=True):
     Represents one quota adjustment for a user
     """
     __tablename__ = "proxy_service_map"
+    __table_args__ = (
+        UniqueConstraint("project_id", "rule", "target", name="unique_proxy_project_rule_target"),
+    )
 
     id: int = Field(primary_key=True)
     created_at: datetime = Field(default=datetime.now())
     latest_dns_check: datetime = Field(default=None, nullable=True)  # Last DNS check timestamp
     latest_dns_check_result: bool = Field(default=None, nullable=True)  # Result of the last DNS check (True/False)
+    next_check_at: datetime = Field(default=None, nullable=True, index=True)  # When the DNS check is due (None = now)
+    dns_check_failures: int = Field(default=0)  # Consecutive failed DNS checks, used for backoff
 
 class ProxyServiceMapPublic(ProxyServiceMapCreate):
     """
@@ -23,14 +23,14 @@ class UserPasswordReset(SQLModel, table=True):
     token: str
     source_ip: str
     created_at: datetime = Field(default=datetime.now())
-    expires_at: datetime
+    expires_at: datetime = Field(index=True)
 
 class Token(SQLModel, table=True):
     """
     This class represents the Token
     """
     id: int = Field(primary_key=True)
-    expires_at: datetime
+    expires_at: datetime = Field(index=True)
     created_at: datetime
     token_id: str
     user_id: int = Field(foreign_key="user.id")
@@ -10,6 +10,29 @@ from neutronclient.v2_0 import client as neutron_client
 from cinderclient import client as cinder_client
 
 from fob_api import Config
+from fob_api.metrics import track_external_call, url_operation
+
+# keystone catalog service type -> dependency name used in metrics
+SERVICE_DEPENDENCIES = {
+    "identity": "keystone",
+    "compute": "nova",
+    "volume": "cinder",
+    "volumev3": "cinder",
+    "block-storage": "cinder",
+    "network": "neutron",
+}
+
+class InstrumentedSession(session.Session):
+    """
+    Keystone session timing every call by service (keystone, nova, cinder, neutron)
+    Calls without service type are the authentication requests sent to keystone
+    """
+
+    def request(self, url, method, *args, **kwargs):
+        service_type = (kwargs.get("endpoint_filter") or {}).get("service_type")
+        dependency = SERVICE_DEPENDENCIES.get(service_type, service_type or "keystone")
+        with track_external_call(dependency, url_operation(method, url)):
+            return super().request(url, method, *args, **kwargs)
 
 def get_session() -> session.Session:
 
@@ -24,7 +47,7 @@ def get_session() -> session.Session:
         project_domain_name=config.os_project_domain_name
     )
 
-    return session.Session(auth=keystone_auth, verify=False)
+    return InstrumentedSession(auth=keystone_auth, verify=False)
 
 def get_keystone_client() -> keystone_client.Client:
     """
@@ -0,0 +1,82 @@
+"""
+Count SQL queries and database time per HTTP request to spot query-per-row loops (N+1)
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Callable
+
+from sqlalchemy import Engine, event
+
+
+class QueryStats:
+    """
+    Queries run during one request (or one block, see count_queries)
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Counter[str] = Counter()
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """
+        :return: statements run at least threshold times, most repeated first
+        """
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+current_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+# called with (route, stats) when a request finishes, used by the tests to assert query counts
+listeners: list[Callable[[str, QueryStats], None]] = []
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_stats.get() is not None:
+        conn.info.setdefault("query_stats_start", []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats.get()
+    if stats is not None and conn.info.get("query_stats_start"):
+        stats.record(statement, perf_counter() - conn.info["query_stats_start"].pop())
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_stats_start"):
+        conn.info["query_stats_start"].pop()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Record statements run on engine in the stats of the current request
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+@contextmanager
+def count_queries():
+    """
+    Collect the queries run in the block (and in threads started from its context)
+    """
+    stats = QueryStats()
+    token = current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_stats.reset(token)
+
+
+def request_finished(route: str, stats: QueryStats) -> None:
+    for listener in listeners:
+        listener(route, stats)
@@ -0,0 +1,134 @@
+"""
+Token bucket rate limiting usable as a FastAPI dependency
+"""
+from math import ceil
+from threading import Lock
+from time import monotonic
+
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+from fob_api import Config, get_redis
+
+
+class MemoryBackend:
+    """
+    Buckets stored in the process memory, each uvicorn worker has its own buckets
+    """
+
+    # hit only takes a thread lock, it runs on the event loop
+    blocking = False
+
+    def __init__(self):
+        # key -> (tokens, last update, time when the bucket is full again)
+        self._buckets: dict[str, tuple[float, float, float]] = {}
+        self._lock = Lock()
+
+    def hit(self, key: str, capacity: int, period: int) -> float:
+        """
+        Take one token from the bucket
+        :return: 0 if allowed else seconds to wait before a token is available
+        """
+        rate = capacity / period
+        with self._lock:
+            now = monotonic()
+            tokens, last, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            retry_after = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                retry_after = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            # drop buckets that are full again to keep memory bounded
+            if len(self._buckets) > 100000:
+                self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+            return retry_after
+
+
+class RedisBackend:
+    """
+    Buckets stored in redis and shared between all workers
+    The bucket update is done atomically in a lua script using redis clock
+    """
+
+    # hit is a network round trip, it runs in the thread pool to keep the event loop free
+    blocking = True
+
+    script = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local last = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - last) * rate)
+    local retry_after = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        retry_after = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(retry_after)
+    """
+
+    def __init__(self):
+        self._script = get_redis().register_script(self.script)
+
+    def hit(self, key: str, capacity: int, period: int) -> float:
+        try:
+            return float(self._script(keys=[key], args=[capacity, capacity / period]))
+        except Exception as e:
+            # fail open, an unavailable redis must not lock everybody out
+            print(f"Rate limit backend error, request allowed: {e}")
+            return 0
+
+
+backend = RedisBackend() if Config().rate_limit_backend == "redis" else MemoryBackend()
+
+
+class RateLimit:
+    """
+    FastAPI dependency limiting calls of a route
+    Usage: Depends(RateLimit("login", Config().rate_limit_login, by="username"))
+    """
+
+    def __init__(self, name: str, rate: tuple[int, int], by: str = "ip"):
+        """
+        :param name: name of the limit, used in the bucket key
+        :param rate: (requests, seconds) allowed per key
+        :param by: "ip" to limit per client ip or the name of a path, query or form field (e.g. "username"),
+            behind a proxy the client ip is the X-Forwarded-For hop resolved by uvicorn (see FORWARDED_ALLOW_IPS)
+        """
+        self.name = name
+        self.capacity, self.period = rate
+        self.by = by
+
+    async def get_key(self, request: Request) -> str | None:
+        if self.by == "ip":
+            return request.client.host if request.client else None
+        value = request.path_params.get(self.by) or request.query_params.get(self.by)
+        if value is None and request.headers.get("content-type", "").startswith(
+                ("application/x-www-form-urlencoded", "multipart/form-data")):
+            # the form is cached on the request so the route can still read it
+            value = (await request.form()).get(self.by)
+        return str(value).lower() if value else None
+
+    async def __call__(self, request: Request) -> None:
+        key = await self.get_key(request)
+        if key is None:
+            return
+        bucket = f"ratelimit:{self.name}:{self.by}:{key}"
+        if backend.blocking:
+            retry_after = await run_in_threadpool(backend.hit, bucket, self.capacity, self.period)
+        else:
+            retry_after = backend.hit(bucket, self.capacity, self.period)
+        if retry_after > 0:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(ceil(retry_after))}
+            )
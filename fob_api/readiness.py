@@ -0,0 +1,172 @@
+"""
+Validation of the external dependencies (keystone, headscale, smtp) when the API starts
+
+The checks run concurrently within VALIDATION_TIMEOUT seconds. A successful validation is cached in redis
+for VALIDATION_CACHE_TTL seconds, keyed by the dependency settings, and while one worker validates the
+others wait for its result, so starting or reloading all the uvicorn workers validates once.
+
+STARTUP_VALIDATION:
+  - strict: validate before serving, the worker does not start if a dependency is invalid (default)
+  - lazy: serve right away and validate in the background until it succeeds, /ready answers 503 until then
+  - off: no validation
+"""
+from datetime import datetime
+from hashlib import sha256
+from threading import Thread
+from time import perf_counter, sleep
+import json
+
+from redis.exceptions import RedisError
+
+from fob_api import Config, get_redis
+from fob_api.locks import Lease
+
+CACHE_PREFIX = "fob:validation:"
+
+# name -> check returning True when the dependency is usable
+CHECKS = {
+    "openstack": lambda config: config.validate_openstack_credentials(),
+    "headscale": lambda config: config.validate_headscale_credentials(),
+    "mail": lambda config: config.validate_email(),
+}
+
+
+class ValidationState:
+    """
+    Last validation result of this process, reported by /ready
+    """
+
+    def __init__(self):
+        self.status = "pending"  # pending, ok, failed or disabled
+        self.checks: dict[str, str] = {}  # check name -> ok, failed or timeout
+        self.validated_at: str | None = None
+        self.cached = False
+
+    @property
+    def ready(self) -> bool:
+        return self.status in ("ok", "disabled")
+
+    def update(self, checks: dict[str, str], validated_at: str, cached: bool = False) -> None:
+        self.checks = checks
+        self.validated_at = validated_at
+        self.cached = cached
+        self.status = "ok" if all(result == "ok" for result in checks.values()) else "failed"
+
+
+state = ValidationState()
+
+
+def fingerprint(config: Config) -> str:
+    """
+    Hash of the settings the checks depend on, a changed setting is validated again
+    """
+    settings = [
+        config.os_auth_url, config.os_username, config.os_password, config.os_project_name,
+        config.os_user_domain_name, config.os_project_domain_name,
+        config.headscale_endpoint, config.headscale_token,
+        config.mail_server, config.mail_port, config.mail_username, config.mail_password, config.mail_sender,
+    ]
+    return sha256(json.dumps(settings).encode()).hexdigest()[:16]
+
+
+def run_checks(timeout: float) -> dict[str, str]:
+    """
+    Run all the checks concurrently
+    :param timeout: seconds to wait for the checks, the ones still running are reported as "timeout"
+    :return: check name -> ok, failed or timeout
+    """
+    config = Config()
+    results = {name: "timeout" for name in CHECKS}
+
+    def run(name: str, check) -> None:
+        try:
+            results[name] = "ok" if check(config) else "failed"
+        except Exception as e:
+            print(f"Validation of {name} failed: {e}")
+            results[name] = "failed"
+
+    # daemon threads, a check stuck on a dead dependency must not block the process exit
+    threads = [Thread(target=run, args=item, name=f"validate-{item[0]}", daemon=True) for item in CHECKS.items()]
+    deadline = perf_counter() + timeout
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(max(deadline - perf_counter(), 0))
+    for thread in threads:
+        if thread.is_alive():
+            print(f"Validation of {thread.name.removeprefix('validate-')} timed out after {timeout}s")
+    return dict(results)
+
+
+def read_cache(key: str) -> dict | None:
+    try:
+        cached = get_redis().get(key)
+    except RedisError as e:
+        print(f"Cannot read cached validation: {e}")
+        return None
+    return json.loads(cached) if cached else None
+
+
+def write_cache(key: str, result: dict, ttl: int) -> None:
+    try:
+        get_redis().set(key, json.dumps(result), ex=ttl)
+    except RedisError as e:
+        print(f"Cannot cache validation: {e}")
+
+
+def validate() -> bool:
+    """
+    Validate the dependencies, or reuse a successful validation of another worker
+    :return: True if all the dependencies are valid
+    """
+    config = Config()
+    if not config.validation_cache_ttl:
+        state.update(run_checks(config.validation_timeout), datetime.now().isoformat())
+        return state.ready
+
+    key = fingerprint(config)
+    cached = read_cache(CACHE_PREFIX + key)
+    if cached is None:
+        # the workers starting together wait for the first one instead of all validating,
+        # without lock (timeout or redis down) the worker validates by itself
+        with Lease(f"validation:{key}", ttl=int(config.validation_timeout) + 30, wait=config.validation_timeout + 5):
+            cached = read_cache(CACHE_PREFIX + key)
+            if cached is None:
+                print("Validating dependencies: " + ", ".join(CHECKS))
+                result = {"checks": run_checks(config.validation_timeout), "validated_at": datetime.now().isoformat()}
+                state.update(**result)
+                if state.ready:
+                    write_cache(CACHE_PREFIX + key, result, config.validation_cache_ttl)
+                return state.ready
+    print(f"Dependencies validated at {cached['validated_at']}, cached validation reused")
+    state.update(**cached, cached=True)
+    return state.ready
+
+
+def validate_in_background() -> Thread:
+    """
+    Validate in a thread, again every VALIDATION_RETRY_INTERVAL seconds until it succeeds
+    """
+    def run() -> None:
+        while not validate():
+            print(f"Dependencies not ready, next validation in {Config().validation_retry_interval}s")
+            sleep(Config().validation_retry_interval)
+
+    thread = Thread(target=run, name="startup-validation", daemon=True)
+    thread.start()
+    return thread
+
+
+def validate_at_startup() -> bool:
+    """
+    Validate the dependencies as configured by STARTUP_VALIDATION
+    :return: False if the API must not start
+    """
+    mode = Config().startup_validation
+    if mode == "off":
+        state.status = "disabled"
+        return True
+    if mode == "lazy":
+        validate_in_background()
+        return True
+    return validate()
@@ -9,3 +9,4 @@ from .headscale import router as headscale_router
 from .openstack import router as openstack_router
 from .quota import router as quota_router
 from .proxy import router as proxy_router
+from .metrics import router as metrics_router
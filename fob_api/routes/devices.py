@@ -5,7 +5,8 @@ from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, JSONResponse
 
-from fob_api import auth, headscale_driver
+from fob_api import auth, headscale_driver, Config
+from fob_api.ratelimit import RateLimit
 from fob_api.lib.headscale import Node, PreAuthKey
 from fob_api.models.api import DevicePreAuthKeyResponse
 from fob_api.models.database import User
@@ -37,7 +38,10 @@ def register_device_get(request: Request, mkey: str):
         context={"mkey": mkey}
     )
 
-@router.post("/register/{mkey}", tags=["vpn"])
+@router.post("/register/{mkey}", tags=["vpn"], dependencies=[
+    Depends(RateLimit("device-register", Config().rate_limit_device_register)),
+    Depends(RateLimit("device-register", Config().rate_limit_device_register, by="username")),
+])
 async def register_device_post(request: Request, mkey: str):
     """
     Handle device registration for headscale require basic auth
@@ -10,7 +10,7 @@ from fob_api.models.api import HeadScalePolicyAcl as HeadScalePolicyAclAPI
 from fob_api.models.api import HeadScalePolicyAclCreate as HeadScalePolicyAclCreateAPI
 from fob_api.models.api import HeadScalePolicyHost as HeadScalePolicyHostAPI
 from fob_api.models.api import HeadScalePolicyHostCreate as HeadScalePolicyHostCreateAPI
-from fob_api.tasks.headscale import update_headscale_policy
+from fob_api.tasks.headscale import apply_headscale_policy
 
 router = APIRouter(prefix="/headscale")
 
@@ -48,7 +48,7 @@ def create(
     session.refresh(new_acl)
 
     try:
-        update_headscale_policy()
+        apply_headscale_policy()
     except Exception as e:
         session.delete(new_acl)
         session.commit()
@@ -77,7 +77,7 @@ def delete(
     session.delete(acl)
     session.commit()
     try:
-        update_headscale_policy()
+        apply_headscale_policy()
     except Exception as e:
         session.add(acl)
         session.commit()
@@ -113,7 +113,7 @@ def create_host(
         raise HTTPException(status_code=400, detail="This host binding already exists")
     session.refresh(new_host)
     try:
-        update_headscale_policy()
+        apply_headscale_policy()
     except Exception as e:
         session.delete(new_host)
         session.commit()
@@ -136,7 +136,7 @@ def delete_host(
     session.delete(host)
     session.commit()
     try:
-        update_headscale_policy()
+        apply_headscale_policy()
     except Exception as e:
         session.add(host)
         session.commit()
@@ -0,0 +1,19 @@
+from secrets import compare_digest
+
+from fastapi import APIRouter, Header, HTTPException, Response
+
+from fob_api import Config
+from fob_api.metrics import render_latest
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics(authorization: str | None = Header(default=None)) -> Response:
+    """
+    Prometheus metrics of the API, aggregated over all uvicorn workers
+    """
+    token = Config().metrics_token
+    if token and not compare_digest(authorization or "", f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
@@ -15,6 +15,7 @@ from fob_api.models.api import OpenStackUserPassword as OpenStackUserPasswordAPI
 from fob_api.tasks.openstack import get_or_create_user as openstack_get_or_create_user
 from fob_api.tasks.openstack import set_user_password as openstack_set_user_password
 from fob_api.tasks import openstack as openstack_tasks
+from fob_api.routes.quota import project_quota_lease, push_project_quota
 
 router = APIRouter(prefix="/openstack")
 
@@ -104,7 +105,7 @@ def delete_openstack_project(
     project = session.exec(select(Project).where(Project.name == project_name)).first()
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-    if project.owner_id != user.id and not user.is_admin:
+    if not auth.get_project_access(user, project.id).is_owner and not user.is_admin:
         raise HTTPException(status_code=403, detail="Not allowed to delete this project")
     
     # check if quota is given to project
@@ -124,6 +125,7 @@ def delete_openstack_project(
     openstack_client.projects.delete(openstack_project.id)
     session.delete(project)
     session.commit()
+    auth.invalidate_project_access(project.id)
 
 @router.put("/users/{username}/reset-password", tags=["openstack"])
 def reset_openstack_user_password(
@@ -153,12 +155,15 @@ def add_user_to_project(
     Add user to project
     """
     db_project = session.exec(select(Project).where(Project.name == project_name)).first()
+    if not db_project:
+        raise HTTPException(status_code=404, detail="Project not found")
     # check if owner of the project or is admin
-    if db_project.owner_id != user.id and not user.is_admin:
+    access = auth.get_project_access(user, db_project.id)
+    if not access.is_owner and not user.is_admin:
         raise HTTPException(status_code=403, detail="Not allowed to add user to this project")
 
     # reject if user is owner of the project
-    if user.username == username and db_project.owner_id == user.id:
+    if user.username == username and access.is_owner:
         raise HTTPException(status_code=400, detail="Cannot add owner to project (owner is already in project)")
 
     # get user to add
@@ -181,6 +186,7 @@ def add_user_to_project(
     os_user = openstack_get_or_create_user(username)
     openstack_client.roles.grant(role=OPENSTACK_ROLE_MEMBER_ID, user=os_user.id, project=os_project.id)
     session.commit()
+    auth.invalidate_project_access(db_project.id, user_to_add.id)
 
 @router.delete("/projects/{project_name}/users/{username}", tags=["openstack"])
 def remove_user_from_project(
@@ -194,25 +200,24 @@ def remove_user_from_project(
     """
     # check if owner of the project or is admin
     db_project = session.exec(select(Project).where(Project.name == project_name)).first()
-    db_project_members_name = [
-        session.exec(select(User).where(User.id == member.user_id)).first().username
-        for member in session.exec(select(ProjectUserMembership).where(ProjectUserMembership.project_id == db_project.id)).all()
-    ]
+    if not db_project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    access = auth.get_project_access(user, db_project.id)
 
     # action allowed if anyone of the following is true
     # 1. user is admin
     # 2. user is owner of the project and wants to remove other user
     # 3. user is not owner of the project and wants to remove himself from project
 
-    if db_project.owner_id != user.id and not user.is_admin and user.username not in db_project_members_name:
+    if not access.is_owner and not user.is_admin and not access.is_member:
         raise HTTPException(status_code=403, detail="Not allowed to remove user from this project")
     
-    if user.username in db_project_members_name:
+    if access.is_member:
         # this avoids the case where user is not owner of the project and wants to remove other user
         username = user.username
     
     # reject if user is owner of the project
-    if user.username == username and db_project.owner_id == user.id:
+    if user.username == username and access.is_owner:
         raise HTTPException(status_code=400, detail="Cannot remove yourself from project (delete project instead)")
 
     # get user to remove    
@@ -233,30 +238,33 @@ def remove_user_from_project(
         raise HTTPException(status_code=500, detail="OpenStack error cant get project")
         
     os_project = openstack.get_keystone_client().projects.find(name=project_name)    
-    # check if user has any quotas assigned to project
-    project_quotas = session.exec(select(db_models.UserQuotaShare).where(db_models.UserQuotaShare.project_id == db_project.id, db_models.UserQuotaShare.user_id == user_to_remove.id)).all()
-    # try to set all quotas to 0
-    old_quotas_map = {k: 0 for k in db_models.QuotaType}
-    for project_quota in project_quotas:
-        old_quotas_map[project_quota.type] = project_quota.quantity
-        project_quota.quantity = 0
-        session.add(project_quota)
-    session.commit()
-
-    # try to sync quotas with openstack without user quotas if it fails rollback quotas
-    try:
-        openstack_tasks.sync_project_quota(os_project)
-    except (nova_exceptions.ClientException, cinder_exceptions.ClientException):
-        # rollback quotas when quota sync fails (when quota is lower than current usage)
+    # quotas are zeroed, committed and pushed under the project lock
+    with project_quota_lease(project_name):
+        # check if user has any quotas assigned to project
+        project_quotas = session.exec(select(db_models.UserQuotaShare).where(db_models.UserQuotaShare.project_id == db_project.id, db_models.UserQuotaShare.user_id == user_to_remove.id)).all()
+        # try to set all quotas to 0
+        old_quotas_map = {k: 0 for k in db_models.QuotaType}
         for project_quota in project_quotas:
-            session.refresh(project_quota)
-            project_quota.quantity = old_quotas_map[project_quota.type]
+            old_quotas_map[project_quota.type] = project_quota.quantity
+            project_quota.quantity = 0
             session.add(project_quota)
         session.commit()
-        raise HTTPException(status_code=400, detail="Cannot remove user from project, user share used quotas with project")
+
+        # try to sync quotas with openstack without user quotas if it fails rollback quotas
+        try:
+            push_project_quota(os_project)
+        except (nova_exceptions.ClientException, cinder_exceptions.ClientException):
+            # rollback quotas when quota sync fails (when quota is lower than current usage)
+            for project_quota in project_quotas:
+                session.refresh(project_quota)
+                project_quota.quantity = old_quotas_map[project_quota.type]
+                session.add(project_quota)
+            session.commit()
+            raise HTTPException(status_code=400, detail="Cannot remove user from project, user share used quotas with project")
     
     # remove user from project
     os_user = openstack_get_or_create_user(username)
     openstack_client.roles.revoke(role=OPENSTACK_ROLE_MEMBER_ID, user=os_user.id, project=os_project.id)
     session.delete(assignment)
     session.commit()
+    auth.invalidate_project_access(db_project.id, user_to_remove.id)
@@ -2,7 +2,7 @@ from datetime import datetime, timedelta
 from typing import Annotated
 import secrets
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlmodel import Session, select
 
 from fob_api import auth, get_session
@@ -23,9 +23,14 @@ security = HTTPBasic()
 
 @router.get("/", tags=["proxy"])
 def get_users(
+        request: Request,
         credentials: Annotated[HTTPBasicCredentials, Depends(security)],
         session: Session = Depends(get_session)
     ):
+    """
+    Traefik dynamic configuration
+    Served with an ETag bound to the config version, If-None-Match answers 304 without any database query
+    """
     if not (secrets.compare_digest(credentials.username, "traefik") and 
             secrets.compare_digest(credentials.password, Config().traefik_config_password)):
         raise HTTPException(
@@ -34,7 +39,25 @@ def get_users(
             headers={"WWW-Authenticate": "Basic"}
         )
     pm = ProxyManager(session)
-    return pm.build_treafik_config()
+    version = pm.get_config_version()
+    headers = {}
+    if version is not None:
+        headers["ETag"] = f'"{version}"'
+        if request.headers.get("if-none-match") == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+    return Response(content=pm.render_traefik_config(version), media_type="application/json", headers=headers)
+
+MAX_BULK_PROXIES = 500
+
+def validate_service_map(pm: ProxyManager, service_map: ProxyServiceMapCreate, prefix: str = "") -> None:
+    """Raise 400 if the target or the rule of a service map is invalid"""
+    if not pm.validate_targets(service_map.target.split(",")):
+        raise HTTPException(status_code=400, detail=f"{prefix}Invalid target format")
+    if service_map.rule.startswith("http://") or service_map.rule.startswith("https://"):
+        raise HTTPException(
+            status_code=400,
+            detail=f"{prefix}Rule must be a domain name, not a URL. Use '`example.com`' format."
+        )
 
 @router.post("/", tags=["proxy"], response_model=ProxyServiceMapPublic)
 def create_proxy_service_map(
@@ -44,20 +67,58 @@ def create_proxy_service_map(
     ):
     project = auth.is_project_owner_or_member(user, service_map.project_id)
     pm = ProxyManager(session)
-    
-    if not pm.validate_targets(service_map.target.split(",")):
-        raise HTTPException(status_code=400, detail="Invalid target format")
-    if service_map.rule.startswith("http://") or service_map.rule.startswith("https://"):
-        raise HTTPException(
-            status_code=400,
-            detail="Rule must be a domain name, not a URL. Use '`example.com`' format."
-        )
+    validate_service_map(pm, service_map)
     return pm.create_proxy(
         project=project,
         rule=service_map.rule,
         target=service_map.target
     )
 
+@router.post("/bulk", tags=["proxy"], response_model=list[ProxyServiceMapPublic])
+def bulk_create_proxy_service_maps(
+        service_maps: list[ProxyServiceMapCreate],
+        session: Session = Depends(get_session),
+        user: User = Depends(auth.get_current_user),
+    ):
+    """
+    Create many proxy service maps at once, already existing ones are returned unchanged
+    Nothing is created if any entry is invalid
+    """
+    if len(service_maps) > MAX_BULK_PROXIES:
+        raise HTTPException(status_code=400, detail=f"Cannot create more than {MAX_BULK_PROXIES} proxies at once")
+    if not service_maps:
+        return []
+    pm = ProxyManager(session)
+    for project_id in {service_map.project_id for service_map in service_maps}:
+        auth.is_project_owner_or_member(user, project_id)
+    for index, service_map in enumerate(service_maps):
+        validate_service_map(pm, service_map, prefix=f"Entry {index}: ")
+    return pm.bulk_create_proxies([
+        (service_map.project_id, service_map.rule, service_map.target)
+        for service_map in service_maps
+    ])
+
+@router.delete("/bulk", tags=["proxy"])
+def bulk_delete_proxy_service_maps(
+        proxy_ids: list[int],
+        session: Session = Depends(get_session),
+        user: User = Depends(auth.get_current_user),
+    ) -> int:
+    """
+    Delete many proxy service maps at once, returns the number of deleted proxies
+    Nothing is deleted if one proxy is missing or not allowed
+    """
+    if len(proxy_ids) > MAX_BULK_PROXIES:
+        raise HTTPException(status_code=400, detail=f"Cannot delete more than {MAX_BULK_PROXIES} proxies at once")
+    pm = ProxyManager(session)
+    proxies = session.exec(select(ProxyServiceMap).where(ProxyServiceMap.id.in_(proxy_ids))).all()
+    missing = set(proxy_ids) - {proxy.id for proxy in proxies}
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Proxy service maps not found: {sorted(missing)}")
+    for project_id in {proxy.project_id for proxy in proxies}:
+        auth.is_project_owner_or_member(user, project_id)
+    return pm.bulk_delete_proxies(proxies)
+
 @router.get("/{project_id}", tags=["proxy"], response_model=list[ProxyServiceMapPublic])
 def get_proxy_service_maps(
         project_id: int,
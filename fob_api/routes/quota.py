@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 from typing import List, Annotated
 
 from fastapi import APIRouter, Depends, HTTPException
@@ -7,6 +8,7 @@ from novaclient import exceptions as nova_exceptions
 from cinderclient import exceptions as cinder_exceptions
 
 from fob_api import auth, engine, openstack, get_session
+from fob_api.locks import Lease
 from fob_api.models import database as db_models
 from fob_api.models import api as api_models
 
@@ -58,13 +60,34 @@ def calculate_project_quota(project: db_models.Project) -> List[api_models.Adjus
             comment="Calculated total all type quota for project"
         ) for k, v in project_max_quota_dict.items()]
 
+@contextmanager
+def project_quota_lease(project_name: str):
+    """
+    Hold the quota lock of a project, one sync per project at a time so two concurrent
+    quota changes cannot push their totals in the wrong order
+    Quota changes are committed and pushed while holding it, so a 409 leaves nothing to roll back
+    :raise HTTPException: 409 if the lock is still held by another sync after 30 seconds
+    """
+    with Lease(f"project:{project_name}:quota", ttl=60, wait=30) as acquired:
+        if not acquired:
+            raise HTTPException(status_code=409, detail="Quota sync already in progress for this project, retry later")
+        yield
+
 def sync_project_quota(openstack_project: db_models.Project) -> None:
+    """
+    Push the quota of the project to nova and cinder
+    """
+    with project_quota_lease(openstack_project.name):
+        push_project_quota(openstack_project)
+
+def push_project_quota(openstack_project: db_models.Project) -> None:
     nova_client = openstack.get_nova_client()
     cinder_client = openstack.get_cinder_client()
     keystone_client = openstack.get_keystone_client()
 
     project_id = keystone_client.projects.find(name=openstack_project.name).id
 
+    # quotas are calculated once the lock is held so the latest values are pushed
     for quota in calculate_project_quota(openstack_project):
         print(f"Syncing quota for project: {openstack_project.name} with type: {quota.type} and quantity: {quota.quantity}")
         match quota.type:
@@ -179,56 +202,53 @@ def set_quota_to_project(
         raise HTTPException(status_code=400, detail="Quantity cannot be less than 1 if you want to remove quota use the delete endpoint")
 
     # check if user is member of the project
-    project_membership = session.exec(
-        select(db_models.ProjectUserMembership)
-        .where(
-            db_models.ProjectUserMembership.project_id == project_find.id,
-            db_models.ProjectUserMembership.user_id == user_find.id)
-    ).first()
-    if not project_membership and project_find.owner_id != user_find.id:
+    project_access = auth.get_project_access(user_find, project_find.id)
+    if not project_access.is_member and not project_access.is_owner:
         raise HTTPException(status_code=400, detail="User not in project")
 
-    quota = session.exec(
-        select(db_models.UserQuotaShare)
-        .where(
-            db_models.UserQuotaShare.user_id == user_find.id,
-            db_models.UserQuotaShare.project_id == project_find.id,
-            db_models.UserQuotaShare.type == create_quota.type
-        )
-    ).first()
-    previous_quantity = 0
-    if quota:
-        previous_quantity = quota.quantity
-
-    # check if user has enough quota to share
-    if get_user_left_quota_by_type(user_find, db_models.QuotaType.from_str(create_quota.type)) + previous_quantity < create_quota.quantity:
-        raise HTTPException(status_code=400, detail="User do not have enough quota to share")
-
-    # check if user has already shared quota
-    if quota:
-        previous_quantity = quota.quantity
-        quota.quantity = create_quota.quantity
-        quota.comment = create_quota.comment
-    else:
-        quota = db_models.UserQuotaShare(
-            user_id=user_find.id,
-            project_id=project_find.id,
-            comment=create_quota.comment,
-            quantity=create_quota.quantity,
-            type=create_quota.type
-        )
-        session.add(quota)
-    if create_quota.quantity == 0:
-        session.delete(quota)
-    session.commit()
-    try:
-        sync_project_quota(project_find)
-    except (nova_exceptions.ClientException, cinder_exceptions.ClientException):
-        session.refresh(quota)
-        quota.quantity = previous_quantity
+    # the share is read, committed and pushed under the project lock
+    with project_quota_lease(project_find.name):
+        quota = session.exec(
+            select(db_models.UserQuotaShare)
+            .where(
+                db_models.UserQuotaShare.user_id == user_find.id,
+                db_models.UserQuotaShare.project_id == project_find.id,
+                db_models.UserQuotaShare.type == create_quota.type
+            )
+        ).first()
+        previous_quantity = 0
+        if quota:
+            previous_quantity = quota.quantity
+
+        # check if user has enough quota to share
+        if get_user_left_quota_by_type(user_find, db_models.QuotaType.from_str(create_quota.type)) + previous_quantity < create_quota.quantity:
+            raise HTTPException(status_code=400, detail="User do not have enough quota to share")
+
+        # check if user has already shared quota
+        if quota:
+            previous_quantity = quota.quantity
+            quota.quantity = create_quota.quantity
+            quota.comment = create_quota.comment
+        else:
+            quota = db_models.UserQuotaShare(
+                user_id=user_find.id,
+                project_id=project_find.id,
+                comment=create_quota.comment,
+                quantity=create_quota.quantity,
+                type=create_quota.type
+            )
+            session.add(quota)
+        if create_quota.quantity == 0:
+            session.delete(quota)
         session.commit()
-        raise HTTPException(status_code=400, detail="Error while setting quota you may use the quota that is already used")
-        # this append when quota is set but project already use the quota so we need to rollback
+        try:
+            push_project_quota(project_find)
+        except (nova_exceptions.ClientException, cinder_exceptions.ClientException):
+            session.refresh(quota)
+            quota.quantity = previous_quantity
+            session.commit()
+            raise HTTPException(status_code=400, detail="Error while setting quota you may use the quota that is already used")
+            # this append when quota is set but project already use the quota so we need to rollback
 
     return calculate_project_quota(project_find)
 
@@ -243,7 +263,7 @@ def show_project_quota(
     project_find = session.exec(select(db_models.Project).where(db_models.Project.name == project_name)).first()
     if not project_find:
         raise HTTPException(status_code=400, detail="Project not found")
-    if not user.is_admin and not session.exec(select(db_models.ProjectUserMembership).where(db_models.ProjectUserMembership.project_id == project_find.id, db_models.ProjectUserMembership.user_id == user.id)).first() and project_find.owner_id != user.id:
+    if not auth.can_access_project(user, project_find.id):
         raise HTTPException(status_code=403, detail="Not allowed to see Total quota for this project")
     return calculate_project_quota(project_find)
 
@@ -257,7 +277,7 @@ def show_project_adjustements(
     project_find = session.exec(select(db_models.Project).where(db_models.Project.name == project_name)).first()
     if not project_find:
         raise HTTPException(status_code=400, detail="Project not found")
-    if not user.is_admin and not session.exec(select(db_models.ProjectUserMembership).where(db_models.ProjectUserMembership.project_id == project_find.id, db_models.ProjectUserMembership.user_id == user.id)).first() and project_find.owner_id != user.id:
+    if not auth.can_access_project(user, project_find.id):
         raise HTTPException(status_code=403, detail="Not allowed to see Adjustements for this project")
 
     shared_quotas = []
@@ -283,6 +303,6 @@ def api_sync_project(
     project_find = session.exec(select(db_models.Project).where(db_models.Project.name == project_name)).first()
     if not project_find:
         raise HTTPException(status_code=400, detail="Project not found")
-    if not user.is_admin and project_find.owner_id != user.id and not session.exec(select(db_models.ProjectUserMembership).where(db_models.ProjectUserMembership.project_id == project_find.id, db_models.ProjectUserMembership.user_id == user.id)).first():
+    if not auth.can_access_project(user, project_find.id):
         raise HTTPException(status_code=403, detail="Not allowed to sync project")
     sync_project_quota(project_find)
@@ -1,10 +1,10 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response
 
-from fob_api import auth
+from fob_api import auth, readiness
 from fob_api.models.database.user import User
-from fob_api.models.api import Me
+from fob_api.models.api import Me, Readiness
 from fob_api.tasks import headscale
 
 router = APIRouter()
@@ -22,3 +22,18 @@ def me(user: Annotated[User, Depends(auth.get_current_user)]) -> Me:
         email=user.email,
         devices_access=devices_access
     )
+
+@router.get("/ready", tags=["status"], response_model=Readiness)
+def ready(response: Response) -> Readiness:
+    """
+    Readiness of the API, 503 until the dependencies are validated (see STARTUP_VALIDATION)
+    """
+    state = readiness.state
+    if not state.ready:
+        response.status_code = 503
+    return Readiness(
+        status=state.status,
+        checks=state.checks,
+        validated_at=state.validated_at,
+        cached=state.cached
+    )
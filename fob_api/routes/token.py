@@ -1,25 +1,22 @@
+from datetime import datetime, timedelta
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlmodel import Session, select
 
-from fob_api import auth, get_session
+from fob_api import auth, get_session, Config
+from fob_api.ratelimit import RateLimit
 from fob_api.models.database import User
 from fob_api.models.database import Token as TokenDB
 from fob_api.models.api import Token, TokenValidate
 
 router = APIRouter()
 
-@router.post("/token", response_model=Token, tags=["token"])
-def get_token(
-        form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-        session: Session = Depends(get_session)
-    ) -> Token:
-    user = auth.basic_auth_validator(form_data.username, form_data.password)
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid credentials")
-    token_data = auth.make_token_data(user.username)
+def store_token(session: Session, user: User, token_data: dict) -> None:
+    """
+    Register a token in database so it can be verified and revoked
+    """
     token_db: TokenDB = TokenDB(
         expires_at=token_data["exp"],
         created_at=token_data["iat"],
@@ -28,24 +25,41 @@ def get_token(
     )
     session.add(token_db)
     session.commit()
+
+@router.post("/token", response_model=Token, tags=["token"], dependencies=[
+    Depends(RateLimit("login", Config().rate_limit_login)),
+    Depends(RateLimit("login", Config().rate_limit_login, by="username")),
+])
+def get_token(
+        form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+        session: Session = Depends(get_session)
+    ) -> Token:
+    user = auth.basic_auth_validator(form_data.username, form_data.password)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    token_data = auth.make_token_data(user.username)
+    if auth.jwt_stateless:
+        # only the refresh token is persisted, access token is verified by signature
+        refresh_token_data = auth.make_token_data(user.username, token_type="refresh")
+        store_token(session, user, refresh_token_data)
+        return Token(
+            access_token=auth.encode_token(token_data),
+            token_type="bearer",
+            refresh_token=auth.encode_token(refresh_token_data)
+        )
+    store_token(session, user, token_data)
     token = auth.encode_token(token_data)
     return Token(access_token=token, token_type="bearer")
 
 
 @router.get("/token/refreshtoken", response_model=Token, tags=["token"])
 def refresh_token(
-        user: Annotated[User, Depends(auth.get_current_user)],
+        user: Annotated[User, Depends(auth.get_refresh_token_user)],
         session: Session = Depends(get_session)
     ) -> Token:
     token_data = auth.make_token_data(user.username)
-    token_db: TokenDB = TokenDB(
-        expires_at=token_data["exp"],
-        created_at=token_data["iat"],
-        token_id=token_data["jti"],
-        user_id=user.id,
-    )
-    session.add(token_db)
-    session.commit()
+    if not auth.jwt_stateless:
+        store_token(session, user, token_data)
     token = auth.encode_token(token_data)
     return Token(access_token=token, token_type="bearer")
 
@@ -53,13 +67,20 @@ def refresh_token(
 def revoke_token(
         jti: str,
         user: Annotated[User, Depends(auth.get_current_user)],
+        bearer: Annotated[str, Depends(auth.oauth2_scheme)],
         session: Session = Depends(get_session)
     ) -> None:
     token = session.exec(select(TokenDB).where(TokenDB.token_id == jti)).first()
-    if not token or token.user_id != user.id:
-        raise HTTPException(status_code=404, detail="Cant revoke token")
-    session.delete(token)
-    session.commit()
+    if token and token.user_id == user.id:
+        session.delete(token)
+        session.commit()
+        return
+    if not token and auth.jwt_stateless and auth.decode_token(bearer)["jti"] == jti:
+        # stateless access tokens are not stored, nothing tells who owns another jti,
+        # so only the token of the request can be revoked, until it expires
+        auth.revoked_tokens.add(jti, datetime.now() + timedelta(minutes=auth.jwt_access_expire_minutes))
+        return
+    raise HTTPException(status_code=404, detail="Cant revoke token")
 
 @router.get("/token/verify", response_model=TokenValidate, tags=["token"])
 def verify_token(user: Annotated[User, Depends(auth.get_current_user)]) -> TokenValidate:
@@ -1,33 +1,110 @@
+import csv
+import json
 from datetime import datetime, timedelta
+from io import StringIO
 from typing import Annotated
 from uuid import uuid4
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlmodel import Session, select
 from celery.result import AsyncResult
 
-from fob_api import auth, engine, mail, get_session
+from fob_api import auth, engine, get_session
 from fob_api import Config
 from fob_api.models.api import TaskInfo, SyncInfo
 from fob_api.models.database import User, UserPasswordReset
 from fob_api.models.api import UserCreate, UserInfo, UserResetPassword, UserPasswordUpdate, UserResetPasswordResponse, UserMeshGroup
 from fob_api.models.database import HeadScalePolicyGroupMember
-from fob_api.tasks.core import sync_user as task_sync_user
-from fob_api.auth import hash_password
+from fob_api.tasks.core import sync_user as task_sync_user, import_users as task_import_users
+from fob_api.tasks.mail import send_mail as task_send_mail
+from fob_api.auth import hash_password, make_unusable_password
 from fob_api.worker import celery
+from fob_api.ratelimit import RateLimit
 
 router = APIRouter(prefix="/users")
 
+# columns of UserInfo, the password hash and other columns are never loaded for listings
+USER_INFO_COLUMNS = (User.id, User.username, User.email, User.is_admin, User.disabled)
+EXPORT_CHUNK_SIZE = 1000
+
+def select_user_infos(
+        cursor: int | None,
+        limit: int,
+        disabled: bool | None = None,
+        is_admin: bool | None = None,
+        synced_before: datetime | None = None
+    ):
+    """
+    Build the keyset paginated query of users ordered by id
+    :param cursor: id of the last user of the previous page
+    """
+    statement = select(*USER_INFO_COLUMNS).order_by(User.id).limit(limit)
+    if cursor is not None:
+        statement = statement.where(User.id > cursor)
+    if disabled is not None:
+        statement = statement.where(User.disabled == disabled)
+    if is_admin is not None:
+        statement = statement.where(User.is_admin == is_admin)
+    if synced_before is not None:
+        statement = statement.where(User.last_synced < synced_before)
+    return statement
+
 @router.get("/", response_model=list[UserInfo], tags=["users"])
 def get_users(
         user: Annotated[User, Depends(auth.get_current_user)],
+        response: Response,
+        cursor: int | None = None,
+        limit: int = Query(default=100, ge=1, le=1000),
+        disabled: bool | None = None,
+        is_admin: bool | None = None,
+        synced_before: datetime | None = None,
         session: Session = Depends(get_session)
     ) -> list[UserInfo]:
     """
-    Returns all users
+    Returns users ordered by id, one page at a time
+    The cursor of the next page is sent in the X-Next-Cursor header, absent on the last page
+    """
+    auth.is_admin(user)
+    rows = session.exec(select_user_infos(cursor, limit, disabled, is_admin, synced_before)).all()
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+    return [
+        UserInfo(username=row.username, email=row.email, is_admin=row.is_admin, disabled=row.disabled)
+        for row in rows
+    ]
+
+@router.get("/export", tags=["users"])
+def export_users(
+        user: Annotated[User, Depends(auth.get_current_user)],
+        disabled: bool | None = None,
+        is_admin: bool | None = None,
+        synced_before: datetime | None = None,
+    ) -> StreamingResponse:
+    """
+    Stream all users as NDJSON (one UserInfo per line)
+    Rows are read by chunks so memory use does not grow with the number of users
     """
     auth.is_admin(user)
-    return [item for item in session.exec(select(User))]
+
+    def generate():
+        # own session, the request session is closed before the body is streamed
+        with Session(engine) as session:
+            cursor = None
+            while True:
+                rows = session.exec(
+                    select_user_infos(cursor, EXPORT_CHUNK_SIZE, disabled, is_admin, synced_before)
+                ).all()
+                for row in rows:
+                    yield UserInfo(
+                        username=row.username, email=row.email, is_admin=row.is_admin, disabled=row.disabled
+                    ).model_dump_json() + "\n"
+                if len(rows) < EXPORT_CHUNK_SIZE:
+                    return
+                cursor = rows[-1].id
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
 @router.post("/", response_model=UserInfo, tags=["users"])
 def create_user(
@@ -46,7 +123,7 @@ def create_user(
     new_user = User(
         email=user_create.email,
         username=user_create.username,
-        password=hash_password(str(uuid4())),
+        password=make_unusable_password(),
         is_admin=False,
         disabled=False
     )
@@ -63,22 +140,14 @@ def create_user(
         expires_at=datetime.now() + timedelta(days=TIME_DAY_DELTA)
     )
     session.add(user_reset_password)
-
-    try:
-        mail.send_mail(new_user.email, 'Your LaboInfra account has been created.', 'account_created.html.j2', {
-            "username": new_user.username,
-            "token": user_reset_password.token,
-            "expire_time": str(TIME_DAY_DELTA) + " days"
-        })
-    except mail.SMTPRecipientsRefused:
-        print("Failed to send email, deleting user")
-        session.delete(new_user)
-    except ConnectionRefusedError:
-        config = Config()
-        print(f"Failed to connect to mail server, leaving user in database ({config.mail_server}:{config.mail_port})")
-    
     session.commit()
 
+    # delivery is done by the worker (pooled connection, retried on transient errors)
+    task_send_mail.delay(new_user.email, 'Your LaboInfra account has been created.', 'account_created.html.j2', {
+        "username": new_user.username,
+        "token": user_reset_password.token,
+        "expire_time": str(TIME_DAY_DELTA) + " days"
+    })
     task_sync_user.delay(new_user.username)
 
     return UserInfo(
@@ -88,6 +157,66 @@ def create_user(
         disabled=new_user.disabled
     )
 
+MAX_IMPORT_USERS = 5000
+
+def parse_user_import(content_type: str, body: bytes) -> list[UserCreate]:
+    """
+    Parse the body of an import, a JSON list of users or a CSV with username and email columns
+    :raise HTTPException: 400 on malformed body or invalid row
+    """
+    try:
+        if content_type.startswith("text/csv"):
+            rows = list(csv.DictReader(StringIO(body.decode("utf-8-sig"))))
+        else:
+            rows = json.loads(body)
+            if not isinstance(rows, list):
+                raise ValueError("Expected a list of users")
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Malformed import: {e}")
+    users = []
+    for index, row in enumerate(rows):
+        try:
+            user_create = UserCreate.model_validate(row)
+        except ValidationError:
+            raise HTTPException(status_code=400, detail=f"Entry {index}: username and email are required")
+        if not user_create.username.strip() or "@" not in user_create.email:
+            raise HTTPException(status_code=400, detail=f"Entry {index}: invalid username or email")
+        users.append(UserCreate(username=user_create.username.strip(), email=user_create.email.strip()))
+    return users
+
+@router.post("/import", response_model=TaskInfo, tags=["users"])
+async def import_users(
+        request: Request,
+        user: Annotated[User, Depends(auth.get_current_user)],
+    ) -> TaskInfo:
+    """
+    Create many users from a JSON list of {username, email} or a CSV file (Content-Type: text/csv)
+    Users that already exist are skipped, follow the progress with GET /users/import/{task_id}
+    """
+    auth.is_admin(user)
+    users = parse_user_import(request.headers.get("content-type", ""), await request.body())
+    if len(users) > MAX_IMPORT_USERS:
+        raise HTTPException(status_code=400, detail=f"Cannot import more than {MAX_IMPORT_USERS} users at once")
+    task = task_import_users.delay([user_create.model_dump() for user_create in users])
+    return TaskInfo(id=task.id, status=task.status, result=None)
+
+@router.get("/import/{task_id}", response_model=TaskInfo, tags=["users"])
+def import_users_status(
+        task_id: str,
+        user: Annotated[User, Depends(auth.get_current_user)]
+    ) -> TaskInfo:
+    """
+    Get user import status, result holds the progress while running and the report once done
+    """
+    auth.is_admin(user)
+    result = AsyncResult(task_id, app=celery)
+    data = None
+    if result.status == "PROGRESS":
+        data = result.info
+    elif result.status == "SUCCESS":
+        data = result.get()
+    return TaskInfo(id=task_id, status=result.status, result=data)
+
 @router.get("/{username}", response_model=UserInfo, tags=["users"])
 def get_user(
         username: str,
@@ -145,11 +274,15 @@ def sync_user_status(
     auth.is_admin_or_self(user, username)
     result = AsyncResult(task_id, app=celery)
     data = ""
-    if result.status == "SUCCESS":
+    # None when the sync was skipped because another sync of the user was running
+    if result.status == "SUCCESS" and result.result is not None:
         data: SyncInfo = result.get().model_dump()
     return TaskInfo(id=task_id, status=result.status, result=data)
 
-@router.post("/{username}/reset-password", response_model=UserResetPasswordResponse, tags=["users"])
+@router.post("/{username}/reset-password", response_model=UserResetPasswordResponse, tags=["users"], dependencies=[
+    Depends(RateLimit("reset-password", Config().rate_limit_password_reset)),
+    Depends(RateLimit("reset-password", Config().rate_limit_password_reset, by="username")),
+])
 def reset_password(
         username: str,
         user_reset_password: UserResetPassword,
@@ -158,7 +291,7 @@ def reset_password(
     """
     Reset user password
     """
-    # Todo add rate limiting and source_ip validation to prevent abuse
+    # Todo add source_ip validation to prevent abuse
     user = session.exec(select(User).where(User.username == username)).first()
     password = user_reset_password.password
     if not user:
@@ -282,7 +415,10 @@ def delete_user_vpn_group(
     new_group = session.exec(select(HeadScalePolicyGroupMember).where(HeadScalePolicyGroupMember.member == username))
     return UserMeshGroup(username=username, groups=[group.name for group in new_group])
 
-@router.post("/forgot-password", response_model=None, tags=["users"])
+@router.post("/forgot-password", response_model=None, tags=["users"], dependencies=[
+    Depends(RateLimit("forgot-password", Config().rate_limit_password_reset)),
+    Depends(RateLimit("forgot-password", Config().rate_limit_password_reset, by="email")),
+])
 def forgot_password(
         email: str,
         session: Session = Depends(get_session)
@@ -299,15 +435,10 @@ def forgot_password(
     )
     session.add(user_reset_password)
     session.commit()
-    try:
-        mail.send_mail(user.email, 'LaboInfra Password Reset', 'account_password_reset.html.j2', {
-            "username": user.username,
-            "token": user_reset_password.token,
-            "expire_time": str(TIME_DELTA) + " minutes"
-        })
-    except mail.SMTPRecipientsRefused:
-        print("Failed to send email, deleting user")
-        session.delete(user)
-        session.commit()
+    task_send_mail.delay(user.email, 'LaboInfra Password Reset', 'account_password_reset.html.j2', {
+        "username": user.username,
+        "token": user_reset_password.token,
+        "expire_time": str(TIME_DELTA) + " minutes"
+    })
 
     raise HTTPException(status_code=418, detail="If you are a teapot, I am a coffee pot")
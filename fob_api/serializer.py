@@ -1,25 +1,109 @@
-from json import JSONEncoder, dumps, loads
+"""
+Celery serializer keeping pydantic models typed across the broker and the result backend
+
+Models are encoded as their JSON dump plus a "__type__" key holding the class name,
+the class is looked up in a registry built once from fob_api.models.api on decode.
+orjson is used when installed (it is a dependency), the stdlib json module otherwise,
+both accept the same payloads: datetimes, dates, times, UUIDs and enums are encoded like orjson does.
+"""
+from datetime import date, datetime, time
+from enum import Enum
+from uuid import UUID
+import json
+
 from pydantic import BaseModel
+
 from fob_api.models import api as api_models
 
-class PydanticSerializer(JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, BaseModel):
-            return obj.model_dump() | {'__type__': type(obj).__name__}
-        else:
-            return JSONEncoder.default(self, obj)
-
-def pydantic_decoder(obj):
-    if '__type__' in obj and obj['__type__'] in dir(api_models):
-        cls = getattr(api_models, obj['__type__'])
-        return cls.parse_obj(obj)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+TYPE_KEY = "__type__"
+
+
+class TypeRegistry:
+    """
+    Name -> pydantic model class of the types allowed to be decoded
+    """
+
+    def __init__(self):
+        self._types: dict[str, type[BaseModel]] = {}
+
+    def register(self, cls: type[BaseModel]) -> type[BaseModel]:
+        """
+        Register a model, usable as a class decorator
+        """
+        self._types[cls.__name__] = cls
+        return cls
+
+    def register_module(self, module) -> None:
+        """
+        Register every pydantic model exposed by a module
+        """
+        for name in dir(module):
+            obj = getattr(module, name)
+            if isinstance(obj, type) and issubclass(obj, BaseModel) and obj is not BaseModel:
+                self.register(obj)
+
+    def get(self, name: str) -> type[BaseModel] | None:
+        return self._types.get(name)
+
+
+registry = TypeRegistry()
+registry.register_module(api_models)
+
+
+def encode_model(obj):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json") | {TYPE_KEY: type(obj).__name__}
+    # orjson encodes these natively, the stdlib needs them here to accept the same payloads
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def decode_object(obj: dict):
+    cls = registry.get(obj.get(TYPE_KEY)) if TYPE_KEY in obj else None
+    if cls is None:
+        return obj
+    return cls.model_validate(obj)
+
+
+def decode_tree(obj):
+    """
+    Apply decode_object bottom-up on a decoded document (orjson has no object_hook)
+    """
+    if isinstance(obj, dict):
+        return decode_object({key: decode_tree(value) for key, value in obj.items()})
+    if isinstance(obj, list):
+        return [decode_tree(value) for value in obj]
     return obj
 
 
+def stdlib_dumps(obj) -> str:
+    return json.dumps(obj, default=encode_model)
+
+
+def stdlib_loads(data):
+    return json.loads(data, object_hook=decode_object)
+
+
+def orjson_dumps(obj) -> str:
+    return orjson.dumps(obj, default=encode_model, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+def orjson_loads(data):
+    return decode_tree(orjson.loads(data))
+
+
 # Encoder function
-def pydantic_dumps(obj):
-    return dumps(obj, cls=PydanticSerializer)
+pydantic_dumps = orjson_dumps if orjson else stdlib_dumps
 
 # Decoder function
-def pydantic_loads(obj):
-    return loads(obj, object_hook=pydantic_decoder)
+pydantic_loads = orjson_loads if orjson else stdlib_loads
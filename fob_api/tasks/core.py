@@ -1,14 +1,23 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from sqlmodel import Session, select
+from sqlmodel import Session, select, update
 from fob_api import engine
 
-from fob_api.models.database import User, Token
+from fob_api.models.database import User, HeadScalePolicyGroupMember
 from fob_api.worker import celery
 from fob_api.tasks import headscale, openstack
+from fob_api.tasks.mail import send_mail_batch
 from fob_api.models.api import SyncInfo
+from fob_api.managers import RetentionManager, UserManager
+from fob_api.locks import single_flight
+
+# validity of the password reset token sent to new accounts
+ACCOUNT_CREATED_RESET_DAYS = 5
+# number of mails sent over one SMTP connection by a send_mail_batch task
+IMPORT_MAIL_BATCH_SIZE = 100
 
 @celery.task()
+@single_flight(lambda username: f"user:{username}:sync", ttl=120, wait=60)
 def sync_user(username: str):
     """
     Sync user with all external services
@@ -32,20 +41,120 @@ def sync_user(username: str):
         last_synced=user.last_synced.isoformat()
     )
 
+@celery.task(name="fastonboard.users.sync_bulk", bind=True)
+def sync_users(self, usernames: list[str]) -> dict:
+    """
+    Sync many users with all external services
+    Same steps as sync_user but the HeadScale group membership is written in one
+    transaction and the HeadScale policy is pushed once for the whole batch
+    """
+    failed = []
+    for done, username in enumerate(usernames):
+        try:
+            headscale.get_or_create_user(username)
+            openstack.get_or_create_user(username)
+        except Exception as e:
+            print(f"Failed to sync user {username}: {e}")
+            failed.append(username)
+        if done % 10 == 0:
+            self.update_state(state="PROGRESS", meta={"total": len(usernames), "synced": done})
+    failed_set = set(failed)
+    synced = [username for username in usernames if username not in failed_set]
+    with Session(engine) as session:
+        members = set(session.exec(
+            select(HeadScalePolicyGroupMember.member)
+            .where(HeadScalePolicyGroupMember.name == "cloud-edge")
+            .where(HeadScalePolicyGroupMember.member.in_(synced))
+        ).all())
+        session.add_all([
+            HeadScalePolicyGroupMember(name="cloud-edge", member=username)
+            for username in synced if username not in members
+        ])
+        session.exec(update(User).where(User.username.in_(synced)).values(last_synced=datetime.now()))
+        session.commit()
+    headscale.update_headscale_policy()
+    return {"synced": len(synced), "failed": failed}
+
+@celery.task(name="fastonboard.users.import", bind=True)
+def import_users(self, users: list[dict]) -> dict:
+    """
+    Create many users at once
+      - one query to find the usernames and emails already taken, those rows are skipped
+        (as are rows created concurrently before their chunk is inserted)
+      - users (unusable password) and reset tokens are inserted in bulk
+      - welcome mails are sent in batches, one sync_users task syncs all new users
+    :param users: list of dict with username and email
+    Progress is reported in the task meta (stage, total, created)
+    """
+    total = len(users)
+    self.update_state(state="PROGRESS", meta={"stage": "checking", "total": total, "created": 0})
+    skipped = []
+    wanted: dict[str, str] = {}
+    seen_emails = set()
+    for user in users:
+        if user["username"] in wanted or user["email"] in seen_emails:
+            skipped.append({**user, "reason": "duplicate in import"})
+            continue
+        wanted[user["username"]] = user["email"]
+        seen_emails.add(user["email"])
+
+    with Session(engine) as session:
+        manager = UserManager(session)
+        taken_usernames, taken_emails = manager.find_existing(list(wanted), list(seen_emails))
+        to_create = []
+        for username, email in wanted.items():
+            if username in taken_usernames or email in taken_emails:
+                skipped.append({"username": username, "email": email, "reason": "already exists"})
+            else:
+                to_create.append((username, email))
+        self.update_state(state="PROGRESS", meta={"stage": "creating", "total": total, "created": 0})
+        created, conflicts = manager.bulk_create_users(to_create, timedelta(days=ACCOUNT_CREATED_RESET_DAYS))
+        skipped.extend(
+            {"username": username, "email": email, "reason": "already exists"} for username, email in conflicts
+        )
+
+    self.update_state(state="PROGRESS", meta={"stage": "notifying", "total": total, "created": len(created)})
+    messages = [
+        {
+            "receivers": email,
+            "subject": "Your LaboInfra account has been created.",
+            "template": "account_created.html.j2",
+            "template_data": {
+                "username": username,
+                "token": token,
+                "expire_time": str(ACCOUNT_CREATED_RESET_DAYS) + " days"
+            },
+        }
+        for username, email, token in created
+    ]
+    for start in range(0, len(messages), IMPORT_MAIL_BATCH_SIZE):
+        send_mail_batch.delay(messages[start:start + IMPORT_MAIL_BATCH_SIZE])
+
+    sync_task = sync_users.delay([username for username, _, _ in created]) if created else None
+    return {
+        "total": total,
+        "created": [username for username, _, _ in created],
+        "skipped": skipped,
+        "sync_task_id": sync_task.id if sync_task else None,
+    }
+
 @celery.task(name="fastonboard.token.purge_expired")
+@single_flight("retention", ttl=300)
 def purge_expired_tokens():
     """
     Purge expired tokens from the database
     """
     with Session(engine) as session:
-      now = datetime.now()
-      tokens: Token = list(session.exec(select(Token).where(Token.expires_at < now)))
-      if tokens_len := len(tokens) == 0:
-        print("No expired tokens found")
-        return 0
-      print(f"Found {tokens_len} expired tokens deleting...")
-      for token in tokens:
-        print(f"Deleting token {token.token_id}")
-        session.delete(token)
-      session.commit()
+      tokens_len = RetentionManager(session).purge_table("token")
+    print(f"Purged {tokens_len} expired tokens")
     return tokens_len
+
+@celery.task(name="fastonboard.retention.purge_expired")
+@single_flight("retention", ttl=300)
+def purge_expired_rows():
+    """
+    Purge expired rows from all time-bounded tables (tokens, password resets)
+    Returns deleted rows count per table and duration of the run
+    """
+    with Session(engine) as session:
+      return RetentionManager(session).purge_all()
@@ -1,45 +1,181 @@
+import asyncio
+import random
+import dns.asyncresolver
 import dns.resolver
-from typing import List, Optional
+from typing import Optional
 
 from datetime import datetime, timedelta
 
-from sqlmodel import Session, select
+from sqlmodel import Session, select, or_
 from fob_api import engine, Config
+from fob_api.dns_cache import dns_cache, timed_resolve
 
-from fob_api.models.database import User, Token
+from fob_api.models.database import ProxyServiceMap
 from fob_api.worker import celery
-from fob_api.tasks import headscale, openstack
-from fob_api.models.api import SyncInfo
 from fob_api.managers import ProxyManager
+from fob_api.locks import single_flight
+
+_async_resolver: dns.asyncresolver.Resolver | None = None
+
+def get_async_resolver() -> dns.asyncresolver.Resolver:
+    """
+    Resolver shared by all checks of the process, timeout applies to each query
+    """
+    global _async_resolver
+    if _async_resolver is None:
+        _async_resolver = dns.asyncresolver.Resolver()
+        _async_resolver.lifetime = Config().dns_check_timeout
+    return _async_resolver
+
+# passing domains are rechecked once a week, failing ones after 15 minutes doubled for each
+# consecutive failure up to one day, a random jitter spreads checks over time
+DNS_RECHECK_PASSING = timedelta(weeks=1)
+DNS_RECHECK_FAILING = timedelta(minutes=15)
+DNS_RECHECK_FAILING_MAX = timedelta(days=1)
+DNS_RECHECK_JITTER = 0.1
+# time a claimed proxy is hidden from other runs, it becomes due again if the run dies
+DNS_CHECK_LEASE = timedelta(minutes=10)
+
+def schedule_next_dns_check(proxy: ProxyServiceMap, result: bool, now: datetime) -> None:
+    """
+    Store a DNS check result and compute when the next check is due
+    """
+    if result:
+        proxy.dns_check_failures = 0
+        delay = DNS_RECHECK_PASSING
+    else:
+        proxy.dns_check_failures = (proxy.dns_check_failures or 0) + 1
+        delay = min(DNS_RECHECK_FAILING * 2 ** (proxy.dns_check_failures - 1), DNS_RECHECK_FAILING_MAX)
+    proxy.latest_dns_check = now
+    proxy.latest_dns_check_result = result
+    proxy.next_check_at = now + delay * (1 + random.uniform(0, DNS_RECHECK_JITTER))
+
+def claim_due_proxies(session: Session, now: datetime, limit: int, shard: int = 0, shards: int = 1) -> list[ProxyServiceMap]:
+    """
+    Select proxies whose DNS check is due and push their next_check_at by DNS_CHECK_LEASE
+    Rows locked by another run are skipped so concurrent runs never check the same proxy
+    """
+    statement = (
+        select(ProxyServiceMap)
+        .where(or_(ProxyServiceMap.next_check_at == None, ProxyServiceMap.next_check_at <= now))
+        .order_by(ProxyServiceMap.next_check_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    if shards > 1:
+        statement = statement.where(ProxyServiceMap.id % shards == shard)
+    proxies = list(session.exec(statement).all())
+    for proxy in proxies:
+        proxy.next_check_at = now + DNS_CHECK_LEASE
+        session.add(proxy)
+    session.commit()
+    return proxies
 
 @celery.task(name="fob_api.tasks.validate_proxy_domain_host")
-def validate_proxy_domain_host():
+@single_flight(lambda shard=0, shards=1: f"dns:check:{shard}/{shards}", ttl=120)
+def validate_proxy_domain_host(shard: int = 0, shards: int = 1):
+    """
+    Check the DNS of proxies that are due (at most DNS_CHECK_BATCH_SIZE per run)
+    Work can be split between several beat entries with shard/shards (proxy id modulo shards)
+    """
 
     CORRECT_IP = Config().traefik_host_ip
 
     with Session(engine) as session:
         pm = ProxyManager(session)
-        for proxy in pm.get_all_proxies():
-            # if proxy enabled recheck domain only one week after last check
-            # if not enabled recheck domain only if last check was 15minutes ago
-            if proxy.latest_dns_check_result:
-                if not proxy.latest_dns_check or proxy.latest_dns_check < datetime.now() - timedelta(weeks=1):
-                    print(f"Checking domain {proxy.rule} for proxy {proxy.id}")
-                    result = check_domain_ip(proxy.rule, CORRECT_IP)
-                    proxy.latest_dns_check = datetime.now()
-                    proxy.latest_dns_check_result = result
-                    print(f"Proxy {proxy.id} domain {proxy.rule} check result: {result}")
-                    session.add(proxy)
-            else:
-                if not proxy.latest_dns_check or proxy.latest_dns_check < datetime.now() - timedelta(minutes=15):
-                    print(f"Checking domain {proxy.rule} for proxy {proxy.id}")
-                    result = check_domain_ip(proxy.rule, CORRECT_IP)
-                    proxy.latest_dns_check = datetime.now()
-                    proxy.latest_dns_check_result = result
-                    print(f"Proxy {proxy.id} domain {proxy.rule} check result: {result}")
-                    session.add(proxy)
+        proxies = claim_due_proxies(session, datetime.now(), Config().dns_check_batch_size, shard, shards)
+        if not proxies:
+            return 0
+        print(f"Checking {len(proxies)} proxy domains")
+        results = asyncio.run(check_domains_ip([proxy.rule for proxy in proxies], CORRECT_IP))
+        print(f"DNS cache stats: {dns_cache.stats()}")
+
+        config_changed = False
+        checked_at = datetime.now()
+        for proxy in proxies:
+            result = results[proxy.rule]
+            config_changed = config_changed or result != bool(proxy.latest_dns_check_result)
+            schedule_next_dns_check(proxy, result, checked_at)
+            print(f"Proxy {proxy.id} domain {proxy.rule} check result: {result}")
+            session.add(proxy)
+        session.commit()
+
+        if config_changed:
+            # active proxies changed, traefik must get a new config
+            pm.bump_config_version()
+    return len(proxies)
+
+@celery.task(name="fob_api.tasks.validate_proxy_domain")
+def validate_proxy_domain(rule: str) -> bool:
+    """
+    Check right away the DNS of all proxies using a rule
+    """
+    return validate_proxy_domains([rule])[rule]
 
+@celery.task(name="fob_api.tasks.validate_proxy_domains")
+def validate_proxy_domains(rules: list[str]) -> dict[str, bool]:
+    """
+    Check right away the DNS of all proxies using one of the rules (enqueued on proxy creation)
+    """
+    try:
+        # explicit check, do not reuse a cached answer from before the record was created
+        results = asyncio.run(check_domains_ip(rules, Config().traefik_host_ip, use_cache=False))
+        with Session(engine) as session:
+            pm = ProxyManager(session)
+            config_changed = False
+            checked_at = datetime.now()
+            for proxy in session.exec(select(ProxyServiceMap).where(ProxyServiceMap.rule.in_(rules))).all():
+                result = results[proxy.rule]
+                config_changed = config_changed or result != bool(proxy.latest_dns_check_result)
+                schedule_next_dns_check(proxy, result, checked_at)
+                print(f"Proxy {proxy.id} domain {proxy.rule} check result: {result}")
+                session.add(proxy)
             session.commit()
+            if config_changed:
+                pm.bump_config_version()
+    finally:
+        pm = ProxyManager(None)
+        for rule in rules:
+            pm.release_dns_check(rule)
+    return results
+
+async def check_domains_ip(domains: list[str], target_ip: str, use_cache: bool = True) -> dict[str, bool]:
+    """
+    Check many domains concurrently, at most DNS_CHECK_CONCURRENCY queries in flight
+    :return: dict domain -> True if domain points to the target IP
+    """
+    semaphore = asyncio.Semaphore(Config().dns_check_concurrency)
+    resolver = get_async_resolver()
+
+    async def check(domain: str) -> tuple[str, bool]:
+        async with semaphore:
+            return domain, await async_check_domain_ip(resolver, domain, target_ip, use_cache)
+
+    return dict(await asyncio.gather(*(check(domain) for domain in set(domains))))
+
+async def async_check_domain_ip(resolver: dns.asyncresolver.Resolver, domain: str, target_ip: str, use_cache: bool = True) -> bool:
+    """
+    Async version of check_domain_ip using a shared resolver and the shared DNS cache
+    """
+    try:
+        if use_cache:
+            ips = await dns_cache.resolve(resolver, domain, 'A')
+        else:
+            ips = [str(rdata) for rdata in await timed_resolve(resolver, domain, 'A')]
+        if not ips:
+            print(f"Error: No A records found for {domain}")
+            return False
+        print(f"Domain {domain} resolves to: {ips}")
+        return target_ip in ips
+    except dns.resolver.NXDOMAIN:
+        print(f"Error: Domain {domain} does not exist")
+        return False
+    except dns.resolver.NoAnswer:
+        print(f"Error: No A records found for {domain}")
+        return False
+    except Exception as e:
+        print(f"Error querying DNS for {domain}: {e}")
+        return False
 
 def check_domain_ip(domain: str, target_ip: str, dns_server: Optional[str] = None) -> bool:
     """
@@ -76,4 +212,4 @@ def check_domain_ip(domain: str, target_ip: str, dns_server: Optional[str] = Non
         return False
     except Exception as e:
         print(f"Error querying DNS: {e}")
-        return False
\ No newline at end of file
+        return False
@@ -4,6 +4,7 @@ from uuid import UUID
 from fob_api.models.database import User, HeadScalePolicyGroupMember
 from fob_api.worker import celery
 from fob_api import engine, headscale_driver
+from fob_api.locks import Lease, single_flight
 from fob_api.lib.headscale import PolicyACL, PolicyData
 
 from fob_api.models.database import (
@@ -87,10 +88,14 @@ def build_headscale_policy_from_db() -> PolicyData:
             )
     return new_pldt
 
-@celery.task(name="fastonboard.headscale.sync_policy")
-def update_headscale_policy() -> tuple:
+# lock shared by the coalesced task and the synchronous pushes of the routes
+POLICY_LOCK = "headscale:policy"
+POLICY_LOCK_TTL = 120
+
+def push_headscale_policy() -> tuple:
     """
-    Update HeadScale Policy Data from Database if there are changes
+    Push the HeadScale Policy built from the Database if it changed, the caller holds POLICY_LOCK
+    :return: (old policy, new policy) or (None, None) if up to date
     """
     new_pldt = build_headscale_policy_from_db()
     old_pldt_str = headscale_driver.policy.dump(headscale_driver.policy.get_policy_data())
@@ -101,3 +106,26 @@ def update_headscale_policy() -> tuple:
         return old_pldt_str, new_pldt_str
     print("HeadScale Policy data is up to date")
     return None, None
+
+def apply_headscale_policy(wait: float = 30) -> tuple:
+    """
+    Push the HeadScale Policy right away, for the routes that roll their change back on failure
+    Waits for a running push instead of coalescing with it, so the change is pushed by this call
+    :param wait: seconds to wait for a running push
+    :raise TimeoutError: if the running push did not finish within wait
+    :return: see push_headscale_policy
+    """
+    with Lease(POLICY_LOCK, ttl=POLICY_LOCK_TTL, wait=wait) as acquired:
+        if not acquired:
+            raise TimeoutError(f"Another HeadScale Policy update is still running after {wait}s")
+        return push_headscale_policy()
+
+@celery.task(name="fastonboard.headscale.sync_policy")
+@single_flight(POLICY_LOCK, ttl=POLICY_LOCK_TTL, rerun_if_skipped=True)
+def update_headscale_policy() -> tuple:
+    """
+    Update HeadScale Policy Data from Database if there are changes
+    Calls made while a push is running (beat, tasks) are coalesced into one more push,
+    a coalesced call returns None and its failure is not reported to the caller (see apply_headscale_policy)
+    """
+    return push_headscale_policy()
@@ -0,0 +1,137 @@
+from smtplib import (
+    SMTPConnectError,
+    SMTPRecipientsRefused,
+    SMTPResponseException,
+    SMTPServerDisconnected,
+)
+from socket import gaierror
+
+from celery.signals import worker_process_init, worker_process_shutdown
+
+from fob_api import mail
+from fob_api.worker import celery
+
+# connection level errors worth retrying, SMTPException subclasses OSError so OSError is not listed:
+# authentication, sender or data rejections are permanent
+TRANSPORT_ERRORS = (SMTPServerDisconnected, SMTPConnectError, ConnectionError, TimeoutError, gaierror)
+
+class TransientMailError(Exception):
+    """
+    Raised in place of a transient SMTP error so Celery retries only those
+    """
+
+def is_transport_error(error: Exception) -> bool:
+    """
+    The connection is unusable after this error
+    """
+    return isinstance(error, TRANSPORT_ERRORS)
+
+def is_transient(error: Exception) -> bool:
+    """
+    Transport errors and 4xx replies (greylisting, mailbox busy...) may succeed later, other errors will not
+    """
+    if is_transport_error(error):
+        return True
+    return isinstance(error, SMTPResponseException) and 400 <= error.smtp_code < 500
+
+def retry_countdown(retries: int) -> int:
+    return min(600, 2 ** retries * 10)
+
+@celery.task(
+    name="fastonboard.mail.send",
+    autoretry_for=(TransientMailError,),
+    retry_backoff=True,
+    retry_backoff_max=600,
+    retry_jitter=True,
+    max_retries=8,
+)
+def send_mail(receivers: str | list, subject: str, template: str, template_data: dict) -> bool:
+    """
+    Render and send an email through the worker SMTP connection pool
+    Transient errors are retried with backoff, permanent ones fail the task
+    """
+    try:
+        mail.send_mail(receivers, subject, template, template_data)
+    except SMTPRecipientsRefused as e:
+        print(f"Mail '{subject}' refused for {receivers}: {e.recipients}")
+        return False
+    except Exception as e:
+        if is_transient(e):
+            raise TransientMailError(f"Mail '{subject}' to {receivers} failed: {e!r}") from e
+        raise
+    return True
+
+def render_messages(messages: list[dict]) -> list[str]:
+    """
+    Render the bodies of a batch, one pass per template
+    :return: bodies in the order of messages
+    """
+    by_template: dict[str, list[int]] = {}
+    for index, message in enumerate(messages):
+        by_template.setdefault(message["template"], []).append(index)
+    bodies = [""] * len(messages)
+    for template, indexes in by_template.items():
+        rendered = mail.render_batch(template, [messages[i]["template_data"] for i in indexes])
+        for index, body in zip(indexes, rendered):
+            bodies[index] = body
+    return bodies
+
+@celery.task(name="fastonboard.mail.send_batch", bind=True, max_retries=8)
+def send_mail_batch(self, messages: list[dict]) -> dict:
+    """
+    Send many emails over one SMTP connection
+    :param messages: list of dict with receivers, subject, template and template_data
+    Messages failing with a transient error are retried together with backoff,
+    messages rejected for good are counted in rejected like refused recipients
+    """
+    sent, refused, rejected, failed = 0, 0, 0, []
+    bodies = render_messages(messages)
+    try:
+        server = mail.pool.acquire()
+    except Exception as e:
+        if not is_transient(e):
+            raise
+        print(f"Cannot connect to the SMTP server, retrying the batch of {len(messages)} mails: {e!r}")
+        raise self.retry(exc=e, countdown=retry_countdown(self.request.retries))
+    broken = True
+    try:
+        for index, (message, body) in enumerate(zip(messages, bodies)):
+            try:
+                mail.send_message(server, message["receivers"], mail.build_message(
+                    message["receivers"], message["subject"], body, 'html'
+                ))
+                sent += 1
+            except SMTPRecipientsRefused as e:
+                print(f"Mail '{message['subject']}' refused for {message['receivers']}: {e.recipients}")
+                refused += 1
+            except Exception as e:
+                if is_transport_error(e):
+                    # connection is gone, the rest of the batch is retried on a new one
+                    print(f"SMTP connection lost: {e!r}")
+                    failed.extend(messages[index:])
+                    break
+                print(f"Mail '{message['subject']}' to {message['receivers']} failed: {e!r}")
+                if is_transient(e):
+                    failed.append(message)
+                else:
+                    rejected += 1
+        else:
+            broken = False
+    finally:
+        # a connection that saw a transport error (or an unexpected one) is never returned to the pool
+        if broken:
+            mail.pool.discard(server)
+        else:
+            mail.pool.release(server)
+    if failed:
+        print(f"{len(failed)} mails failed, retrying")
+        raise self.retry(args=[failed], countdown=retry_countdown(self.request.retries))
+    return {"sent": sent, "refused": refused, "rejected": rejected}
+
+@worker_process_init.connect
+def preload_mail_templates(**kwargs):
+    print(f"Mail templates loaded: {', '.join(mail.preload_templates())}")
+
+@worker_process_shutdown.connect
+def close_smtp_connections(**kwargs):
+    mail.pool.close_all()
@@ -0,0 +1,57 @@
+from time import perf_counter
+
+from celery.signals import (
+    task_failure,
+    task_postrun,
+    task_prerun,
+    task_retry,
+    worker_process_shutdown,
+    worker_ready,
+)
+from prometheus_client import start_http_server
+
+from fob_api import Config, metrics
+
+# task id -> (start time, token of the current_task context var)
+_running: dict[str, tuple[float, object]] = {}
+
+@task_prerun.connect
+def task_started(task_id=None, task=None, **kwargs):
+    _running[task_id] = (perf_counter(), metrics.current_task.set(task.name))
+
+@task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _running.pop(task_id, None)
+    if started is None:
+        return
+    start, token = started
+    metrics.task_duration.labels(task.name, state or "UNKNOWN").observe(perf_counter() - start)
+    try:
+        metrics.current_task.reset(token)
+    except ValueError:
+        # postrun sent from another context than prerun
+        metrics.current_task.set(None)
+
+@task_retry.connect
+def task_retried(sender=None, **kwargs):
+    metrics.task_retries.labels(sender.name).inc()
+
+@task_failure.connect
+def task_failed(sender=None, exception=None, **kwargs):
+    metrics.task_failures.labels(sender.name, type(exception).__name__).inc()
+
+@worker_ready.connect
+def start_metrics_exporter(**kwargs):
+    """
+    Serve the metrics of the worker (and of its pool processes in multiprocess mode)
+    """
+    port = Config().worker_metrics_port
+    if not port:
+        return
+    start_http_server(port, registry=metrics.get_registry())
+    print(f"Worker metrics exported on port {port}")
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    if pid:
+        metrics.mark_process_dead(pid)
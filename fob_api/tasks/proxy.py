@@ -0,0 +1,40 @@
+from os import replace
+
+from celery.signals import worker_ready
+from sqlmodel import Session
+
+from fob_api import engine, Config
+from fob_api.worker import celery
+from fob_api.managers import ProxyManager
+from fob_api.locks import single_flight
+
+@celery.task(name="fastonboard.proxy.publish_config")
+@single_flight("traefik:publish", rerun_if_skipped=True)
+def publish_traefik_config() -> int | None:
+    """
+    Write the rendered traefik config to TRAEFIK_CONFIG_FILE
+    Traefik file provider watches the file and reloads on change, the json content is valid yaml
+    so use a .yml path. The file is replaced atomically to never expose a partial config.
+    """
+    path = Config().traefik_config_file
+    if not path:
+        print("TRAEFIK_CONFIG_FILE is not set, nothing to publish")
+        return None
+    with Session(engine) as session:
+        pm = ProxyManager(session)
+        version = pm.get_config_version()
+        body = pm.render_traefik_config(version)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(body)
+    replace(tmp_path, path)
+    print(f"Traefik config version {version} published to {path}")
+    return version
+
+@worker_ready.connect
+def publish_traefik_config_on_start(**kwargs):
+    """
+    Make sure the file exists and is up to date when a worker starts
+    """
+    if Config().traefik_config_file:
+        publish_traefik_config.delay()
@@ -1,10 +1,15 @@
 
+from os import environ
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlmodel import Session, SQLModel, create_engine
 from sqlmodel.pool import StaticPool
 
-from fob_api import get_session
+# the tests run against sqlite, do not validate the external services when importing the app
+environ.setdefault("STARTUP_VALIDATION", "off")
+
+from fob_api import get_session, querystats
 from fob_api.main import app
 
 @pytest.fixture(name="session")
@@ -12,6 +17,7 @@ def session_fixture():
     engine = create_engine(
         "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
     )
+    querystats.instrument_engine(engine)
     SQLModel.metadata.create_all(engine)
     with Session(engine) as session:
         yield session
@@ -27,6 +33,42 @@ def client_fixture(session: Session):
     app.dependency_overrides.clear()
 
 
+class QueryCounter:
+    """
+    Query stats of the requests made during a test, by "METHOD /route/template"
+    Usage:
+        client.get("/users/")
+        query_counter.assert_max("GET /users/", 2)
+    """
+
+    def __init__(self):
+        # (route, stats, query count when the request was reported)
+        self.requests: list[tuple[str, querystats.QueryStats, int]] = []
+
+    def __call__(self, route: str, stats: querystats.QueryStats) -> None:
+        self.requests.append((route, stats, stats.count))
+
+    def counts(self, route: str) -> list[int]:
+        return [count for name, _, count in self.requests if name == route]
+
+    def assert_max(self, route: str, max_queries: int) -> None:
+        counts = self.counts(route)
+        assert counts, f"No request made to {route}"
+        assert max(counts) <= max_queries, f"{route} ran {max(counts)} queries, expected at most {max_queries}"
+
+    def assert_no_repeated(self, route: str, threshold: int = 2) -> None:
+        for name, stats, _ in self.requests:
+            if name == route:
+                assert not stats.repeated(threshold), f"{route} repeats statements: {stats.repeated(threshold)}"
+
+@pytest.fixture(name="query_counter")
+def query_counter_fixture():
+    counter = QueryCounter()
+    querystats.listeners.append(counter)
+    yield counter
+    querystats.listeners.remove(counter)
+
+
 def test_create(client: TestClient):
     response = client.post(
         "/test/", json={"name": "Deadpond", "secret_name": "Dive Wilson"}
@@ -0,0 +1,73 @@
+"""
+Query budgets of the hot endpoints, a query per row loop (N+1) makes them fail
+"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, insert
+
+from fob_api import Config, auth
+from fob_api.main import app
+from fob_api.models.database import Project, ProxyServiceMap, User
+from fob_api.routes import users as users_routes
+
+
+@pytest.fixture(name="admin")
+def admin_fixture(session: Session):
+    admin = User(username="admin", email="admin@laboinfra.net", password="!", is_admin=True)
+    session.add(admin)
+    session.commit()
+    session.refresh(admin)
+    # detached so the commits of the tests do not expire it (a reload would count as a query of the request)
+    session.expunge(admin)
+    app.dependency_overrides[auth.get_current_user] = lambda: admin
+    yield admin
+    app.dependency_overrides.pop(auth.get_current_user, None)
+
+
+def seed_users(session: Session, count: int) -> None:
+    session.exec(insert(User), params=[
+        {"username": f"user-{i}", "email": f"user-{i}@laboinfra.net", "password": "!"} for i in range(count)
+    ])
+    session.commit()
+
+
+def test_list_users_query_budget(client: TestClient, session: Session, admin: User, query_counter):
+    seed_users(session, 150)
+    first_page = client.get("/users/", params={"limit": 100})
+    assert first_page.status_code == 200
+    next_page = client.get("/users/", params={"limit": 100, "cursor": first_page.headers["X-Next-Cursor"]})
+    assert len(first_page.json()) + len(next_page.json()) == 151
+
+    query_counter.assert_max("GET /users/", 1)
+    query_counter.assert_no_repeated("GET /users/")
+
+
+def test_export_users_counts_streamed_queries(
+        client: TestClient, session: Session, admin: User, query_counter, monkeypatch
+    ):
+    # the export opens its own session on the app engine
+    monkeypatch.setattr(users_routes, "engine", session.get_bind())
+    monkeypatch.setattr(users_routes, "EXPORT_CHUNK_SIZE", 100)
+    seed_users(session, 250)
+    response = client.get("/users/export")
+    assert len(response.text.splitlines()) == 251
+
+    # one query per chunk, run while the body streams
+    assert query_counter.counts("GET /users/export") == [3]
+
+
+def test_traefik_config_query_budget(client: TestClient, session: Session, admin: User, query_counter):
+    session.exec(insert(Project), params=[{"name": f"project-{i}", "owner_id": admin.id} for i in range(20)])
+    session.exec(insert(ProxyServiceMap), params=[{
+        "project_id": i % 20 + 1,
+        "rule": f"service-{i}.students.laboinfra.net",
+        "target": f"http://172.16.0.{i % 250 + 1}:8080",
+        "latest_dns_check_result": True,
+    } for i in range(200)])
+    session.commit()
+    response = client.get("/proxy/", auth=("traefik", Config().traefik_config_password))
+    assert response.status_code == 200
+    assert len(response.json()["http"]["routers"]) == 400
+
+    query_counter.assert_max("GET /proxy/", 1)
+    query_counter.assert_no_repeated("GET /proxy/")
@@ -1,4 +1,5 @@
 from fob_api import Config, HeadScale
+from fob_api.metrics import InstrumentedHTTPSession
 config = Config()
 
-headscale_driver = HeadScale(config.headscale_endpoint, config.headscale_token)
+headscale_driver = HeadScale(config.headscale_endpoint, config.headscale_token, session=InstrumentedHTTPSession("headscale"))
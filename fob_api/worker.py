@@ -1,6 +1,8 @@
 from celery import Celery
+from celery.signals import celeryd_init
 from fob_api import Config
 from fob_api import serializer as pydantic_serializer
+from kombu import Queue
 from kombu.serialization import register
 
 # Register the serializer
@@ -12,6 +14,30 @@ register(
     content_encoding="utf-8"
 )
 
+# queue -> (processes, prefetch multiplier) used by a worker consuming only this queue
+# slow external calls get prefetch 1 so a long task does not hold queued tasks back
+QUEUE_SETTINGS = {
+    "celery": (4, 4),        # default queue, tasks without route
+    "identity": (4, 1),      # user sync with headscale / keystone, user import
+    "policy": (1, 1),        # headscale policy and traefik config pushes, serialized anyway
+    "quota": (2, 1),         # nova / cinder quota sync
+    "dns": (2, 1),           # proxy DNS checks (concurrent lookups inside a task)
+    "mail": (4, 4),          # smtp delivery
+    "housekeeping": (1, 4),  # purges and other cheap periodic tasks
+}
+
+TASK_ROUTES = {
+    "fob_api.tasks.core.sync_user": {"queue": "identity"},
+    "fastonboard.users.*": {"queue": "identity"},
+    "fastonboard.headscale.*": {"queue": "policy"},
+    "fastonboard.proxy.*": {"queue": "policy"},
+    "fastonboard.quota.*": {"queue": "quota"},
+    "fob_api.tasks.validate_proxy_domain*": {"queue": "dns"},
+    "fastonboard.mail.*": {"queue": "mail"},
+    "fastonboard.token.*": {"queue": "housekeeping"},
+    "fastonboard.retention.*": {"queue": "housekeeping"},
+}
+
 config = Config()
 celery = Celery(__name__)
 celery.conf.update(
@@ -30,13 +56,16 @@ celery.conf.update(
         "application/x-pydantic"
     ],
     worker_pool_restarts=True,
+    task_default_queue="celery",
+    task_queues=[Queue(name) for name in QUEUE_SETTINGS],
+    task_routes=TASK_ROUTES,
     beat_schedule={
         'fastonboard.headscale.sync_policy': {
             'task': 'fastonboard.headscale.sync_policy',
             'schedule': 60 * 15  # every 15min
         },
-        'fastonboard.token.purge_expired': {
-            'task': 'fastonboard.token.purge_expired',
+        'fastonboard.retention.purge_expired': {
+            'task': 'fastonboard.retention.purge_expired',
             'schedule': 60 * 60 * 24 # every day
         },
         'validate_proxy_domain_host': {
@@ -45,5 +74,25 @@ celery.conf.update(
         }
     }
 )
+@celeryd_init.connect
+def configure_worker_for_queues(conf=None, options=None, **kwargs):
+    """
+    Size the worker for the queues it consumes (-Q), unless set on the command line
+    concurrency is the sum of the queues processes, prefetch the lowest multiplier
+    """
+    queues = options.get("queues")
+    if not queues:
+        # all queues, keep celery defaults (one process per cpu)
+        return
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    settings = [QUEUE_SETTINGS.get(queue.strip(), QUEUE_SETTINGS["celery"]) for queue in queues]
+    if not options.get("concurrency"):
+        conf.worker_concurrency = sum(processes for processes, _ in settings)
+    if not options.get("prefetch_multiplier"):
+        conf.worker_prefetch_multiplier = min(prefetch for _, prefetch in settings)
+    print(f"Worker consuming {', '.join(queues)} with concurrency {conf.worker_concurrency} "
+          f"and prefetch multiplier {conf.worker_prefetch_multiplier}")
+
 # import need to be after celery is defined to avoid circular import
-from fob_api.tasks import core, headscale, dns_cmd
+from fob_api.tasks import core, headscale, dns_cmd, proxy, mail, metrics